@@ -1,19 +1,44 @@
 import logging
 
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+from utils.loop_utils import LoopLagMonitor
 
 logger = logging.getLogger(__name__)
 
+LOOP_LAG_WARNING_SECONDS = 1.0
+
 
 class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.lag_monitor = LoopLagMonitor()
+
+        self.loop_lag_sampler.start()
 
     @commands.command()
     @commands.is_owner()
     async def admin(self, ctx):
         await ctx.channel.send(f"Active servers: {[guild.name for guild in self.bot.guilds]}")
 
+    @commands.command()
+    @commands.is_owner()
+    async def lag(self, ctx):
+        stats = self.lag_monitor.stats()
+        await ctx.channel.send(f"Event loop lag over last {stats['samples']} samples: "
+                               f"avg {stats['avg_ms']:.1f}ms, p99 {stats['p99_ms']:.1f}ms, "
+                               f"max {stats['window_max_ms']:.1f}ms (since startup: {stats['max_ms']:.1f}ms)")
+
+    @tasks.loop(seconds=0.0)
+    async def loop_lag_sampler(self):
+        lag = await self.lag_monitor.sample()
+
+        if lag > LOOP_LAG_WARNING_SECONDS:
+            logger.warning(f'Event loop was blocked for {lag:.2f}s')
+
+    def cog_unload(self):
+        self.loop_lag_sampler.cancel()
+
 
 def setup(bot):
     bot.add_cog(Admin(bot))
@@ -2,26 +2,39 @@ import asyncio
 import json
 import logging
 import os
-import time
+from datetime import datetime
+from functools import partial
 
-from aiohttp import ClientConnectionError
 from discord.ext import commands, tasks
 
-from utils.instagram_utils import get_insta_timeline, extract_post_count, extract_recent_posts
+from utils.discord_utils import send_embeds, pack_lines
+from utils.retry_utils import get_retry_scheduler
+from utils.instagram_utils import get_insta_timeline, extract_post_count, find_new_posts, get_post_state, \
+    extract_post_times
+from utils.poll_utils import PollScheduler
 from utils.discord_embed_insta_utils import get_insta_embeds, get_insta_video_urls, get_insta_post_url
 
 logger = logging.getLogger(__name__)
 
+INSTA_WARMUP_CONCURRENCY = 4
+
 
 class InstaStalker(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.stalk_destinations = {}
-        self.last_post_count = {}
+        self.post_state = {}
+        self.retry_scheduler = get_retry_scheduler()
+        self.poll_scheduler = PollScheduler()
 
         self.load_destinations()
-        self.setup_last_post_count()
+        self.load_post_state()
+
+        for user_id in self.stalk_destinations:
+            self.poll_scheduler.add(user_id)
 
+        # Users are polled as soon as their own baseline is in, startup doesn't wait for any of them
+        self.warmup_task = self.bot.loop.create_task(self.setup_post_state())
         self.discord_poster.start()
 
     def load_destinations(self):
@@ -29,58 +42,110 @@ class InstaStalker(commands.Cog):
         with open(path) as f:
             self.stalk_destinations = json.load(f)
 
+    def load_post_state(self):
+        path = os.path.join(os.getcwd(), 'data', 'insta_state.json')
+
+        try:
+            with open(path) as f:
+                self.post_state = json.load(f)
+        except FileNotFoundError:
+            self.post_state = {}
+
+    def save_post_state(self):
+        path = os.path.join(os.getcwd(), 'data', 'insta_state.json')
+        with open(path, 'w') as f:
+            json.dump(self.post_state, f, indent=4)
+
     def save_destinations(self):
         path = os.path.join(os.getcwd(), 'data', 'insta.json')
         with open(path, 'w') as f:
             f.seek(0)
             json.dump(self.stalk_destinations, f, indent=4)
 
-    def setup_last_post_count(self):
-        for user_id in self.stalk_destinations:
-            user_timeline = get_insta_timeline(user_id)
-            self.last_post_count[user_id] = extract_post_count(user_timeline)
+    async def setup_post_state(self):
+        # Requests are paced by the Instagram rate limit, this only bounds how many are in flight
+        semaphore = asyncio.Semaphore(INSTA_WARMUP_CONCURRENCY)
+
+        async def setup_user(user_id):
+            async with semaphore:
+                user_timeline = await get_insta_timeline(user_id)
+
+            if user_timeline is None:
+                logger.info(f'Could not fetch a baseline for @{user_id}, will retry on the next poll')
+                return
 
+            self.post_state[user_id] = get_post_state(user_timeline)
+            self.poll_scheduler.record_poll(user_id, extract_post_times(user_timeline))
             logger.info(f'User @{user_id} has {extract_post_count(user_timeline)} posts')
-            time.sleep(5)
 
-    @tasks.loop(minutes=30.0)
+        # Users with a saved state pick up where they left off, only new ones need a baseline
+        user_ids = [user_id for user_id in self.stalk_destinations if user_id not in self.post_state]
+        await asyncio.gather(*[setup_user(user_id) for user_id in user_ids])
+        self.save_post_state()
+
+    @commands.command()
+    @commands.is_owner()
+    async def instapolls(self, ctx):
+        lines = []
+
+        for user_id, schedule in sorted(self.poll_scheduler.stats().items(), key=lambda x: x[1]['next_poll_at']):
+            next_poll_at = datetime.fromtimestamp(schedule['next_poll_at']).strftime('%H:%M:%S')
+            lines.append(f'@{user_id}: every {schedule["interval"] / 60:.0f} min, next at {next_poll_at}')
+
+        if not lines:
+            await ctx.channel.send('No Instagram users stalked!')
+            return
+
+        for message in pack_lines(lines):
+            await ctx.channel.send(message)
+
+    @tasks.loop(seconds=30.0)
     async def discord_poster(self):
-        for user_id in self.stalk_destinations:
+        # Each account has its own interval, only the ones that are due get fetched
+        for user_id in self.poll_scheduler.due():
+            if user_id not in self.post_state and not self.warmup_task.done():
+                continue
+
             user_timeline = await get_insta_timeline(user_id)
-            curr_post_count = extract_post_count(user_timeline)
 
-            if self.last_post_count[user_id] < curr_post_count:
-                num_posts_to_fetch = curr_post_count - self.last_post_count[user_id]
-                new_posts = extract_recent_posts(user_timeline, max_posts=num_posts_to_fetch)
-                new_posts.reverse()
+            if user_timeline is None:
+                self.poll_scheduler.record_poll(user_id, [])
+                continue
+
+            self.poll_scheduler.record_poll(user_id, extract_post_times(user_timeline))
+
+            if user_id not in self.post_state:
+                # Warm-up could not get a baseline, this fetch becomes it
+                self.post_state[user_id] = get_post_state(user_timeline)
+                continue
 
-                for post in new_posts:
-                    shortcode = post['shortcode']
-                    embeds = await get_insta_embeds(post=post, user=user_timeline)
-                    video_urls = await get_insta_video_urls(post=post)
+            for post in find_new_posts(user_timeline, self.post_state[user_id]):
+                shortcode = post['shortcode']
+                embeds = await get_insta_embeds(post=post, user=user_timeline)
+                video_urls = await get_insta_video_urls(post=post)
 
-                    for channel_id in self.stalk_destinations[user_id]:
-                        channel = self.bot.get_channel(channel_id)
+                for channel_id in self.stalk_destinations[user_id]:
+                    await self.retry_scheduler.call('instagram', f'send {shortcode} to {channel_id}',
+                                                    partial(self.send_post, shortcode, channel_id, embeds, video_urls))
 
-                        for embed in embeds:
-                            while True:
-                                try:
-                                    await channel.send(embed=embed)
-                                    break
-                                except ClientConnectionError:
-                                    pass
+            self.post_state[user_id] = get_post_state(user_timeline, previous_state=self.post_state[user_id])
+            self.save_post_state()
 
-                        if video_urls:
-                            for video_url in video_urls:
-                                await channel.send(video_url)
+    async def send_post(self, shortcode, channel_id, embeds, video_urls):
+        channel = self.bot.get_channel(channel_id)
+        await send_embeds(self.bot.http, channel_id, embeds)
 
-                    logger.info(f'{get_insta_post_url(shortcode)} sent to #{channel.name} in {channel.guild.name}')
+        if video_urls:
+            for message in pack_lines(video_urls):
+                await channel.send(message)
 
-            self.last_post_count[user_id] = curr_post_count
-            await asyncio.sleep(10)
+        logger.info(f'{get_insta_post_url(shortcode)} sent to #{channel.name} in {channel.guild.name}')
 
     def cog_unload(self):
+        self.warmup_task.cancel()
         self.discord_poster.cancel()
+        self.retry_scheduler.cancel('instagram')
+        self.save_post_state()
         self.save_destinations()
 
     @discord_poster.before_loop
@@ -1,24 +1,28 @@
-import logging
-from queue import Queue
 import asyncio
+import logging
+from functools import partial
 
-from aiohttp import ClientConnectionError
-from discord.ext import commands, tasks
+from discord.ext import commands
 
-from utils.discord_utils import clean_message
+from utils.discord_utils import clean_message, send_embeds, pack_lines
 from utils.discord_embed_insta_utils import get_insta_embeds, get_insta_video_urls, get_insta_post_url
 from utils.instagram_utils import get_insta_post
+from utils.retry_utils import get_retry_scheduler
 from utils.url_utils import get_insta_shortcodes
+from utils.worker_utils import ChannelWorkerPool
 
 logger = logging.getLogger(__name__)
 
+# Posts being sent at once across all channels, Instagram fetches are paced separately by its rate limit
+INSTA_POST_WORKERS = 4
+
 
 class PostInstaMedia(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.insta_queue = Queue()
-
-        self.discord_poster.start()
+        self.retry_scheduler = get_retry_scheduler()
+        self.channel_workers = ChannelWorkerPool(max_concurrency=INSTA_POST_WORKERS)
+        self.fetch_failures = 0
 
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -28,39 +32,57 @@ class PostInstaMedia(commands.Cog):
         cleaned_message = clean_message(message.content)
 
         for shortcode in get_insta_shortcodes(cleaned_message):
-            self.insta_queue.put((shortcode, message))
+            # Fetch every link right away, the channel worker only keeps the posts in the order they were linked
+            post_task = asyncio.ensure_future(self.fetch_post(shortcode))
+            self.channel_workers.submit(message.channel.id, partial(self.post_insta_media, shortcode, message, post_task))
 
         await self.bot.process_commands(message)
 
-    @tasks.loop(seconds=1.0)
-    async def discord_poster(self):
-        if not self.insta_queue.empty():
-            try:
-                shortcode, message = self.insta_queue.get()
-                post = await get_insta_post(shortcode)
-                if post is None:
-                    return
-
-                embeds = await get_insta_embeds(post=post)
-
-                for embed in embeds:
-                    while True:
-                        try:
-                            await message.channel.send(embed=embed)
-                            break
-                        except ClientConnectionError:
-                            pass
-
-                video_urls = await get_insta_video_urls(post=post)
-
-                if video_urls:
-                    for video_url in video_urls:
-                        await message.channel.send(video_url)
-
-                logger.info(f"{get_insta_post_url(shortcode)} sent to #{message.channel.name} in {message.guild.name}")
-                await asyncio.sleep(10)
-            except:
-                pass
+    @commands.command()
+    @commands.is_owner()
+    async def instaqueue(self, ctx):
+        stats = {
+            'Workers': self.channel_workers.stats(),
+            'Fetch failures': self.fetch_failures,
+            'Retries': self.retry_scheduler.stats('instagram'),
+        }
+
+        await ctx.channel.send('\n'.join(f'{name}: {value}' for name, value in stats.items()))
+
+    async def fetch_post(self, shortcode):
+        post = await get_insta_post(shortcode)
+
+        if post is None:
+            self.fetch_failures += 1
+            logger.info(f'Could not fetch {get_insta_post_url(shortcode)}')
+            return None
+
+        embeds = await get_insta_embeds(post=post)
+        video_urls = await get_insta_video_urls(post=post)
+
+        return embeds, video_urls
+
+    async def post_insta_media(self, shortcode, message, post_task):
+        fetched_post = await post_task
+
+        if fetched_post is None:
+            return
+
+        embeds, video_urls = fetched_post
+        await self.retry_scheduler.call('instagram', f'send {shortcode} to {message.channel.id}',
+                                        partial(self.send_post, shortcode, message, embeds, video_urls))
+
+    async def send_post(self, shortcode, message, embeds, video_urls):
+        await send_embeds(self.bot.http, message.channel.id, embeds)
+
+        if video_urls:
+            for video_message in pack_lines(video_urls):
+                await message.channel.send(video_message)
+
+        logger.info(f"{get_insta_post_url(shortcode)} sent to #{message.channel.name} in {message.guild.name}")
+
+    def cog_unload(self):
+        self.channel_workers.cancel()
 
 
 def setup(bot):
@@ -3,9 +3,9 @@ import logging
 from discord.ext import commands
 from tweepy import TweepError
 
-from utils.discord_utils import clean_message
+from utils.discord_utils import clean_message, send_embeds, pack_lines
 from utils.discord_embed_twitter_utils import get_tweet_embeds
-from utils.twitter_utils import extract_photo_urls, extract_video_url, get_tweet, get_tweet_url, is_quote
+from utils.twitter_utils import extract_photo_urls, extract_video_url, get_tweet_async, get_tweet_url, is_quote
 from utils.url_utils import get_tweet_ids
 
 logger = logging.getLogger(__name__)
@@ -25,10 +25,9 @@ class PostTweetMedia(commands.Cog):
             await ctx.channel.send("Message does not contain a Twitter link!")
             return
 
-        tweet = get_tweet(tweet_ids[0])
+        tweet = await get_tweet_async(tweet_ids[0])
 
-        for embed in get_tweet_embeds(tweet):
-            await ctx.channel.send(embed=embed)
+        await send_embeds(self.bot.http, ctx.channel.id, await get_tweet_embeds(tweet))
 
         logger.info(f'{get_tweet_url(tweet)} sent to #{ctx.channel.name} in {ctx.guild.name}')
 
@@ -40,7 +39,7 @@ class PostTweetMedia(commands.Cog):
             await ctx.channel.send("Message does not contain a Twitter link!")
             return
 
-        tweet = get_tweet(tweet_ids[0])
+        tweet = await get_tweet_async(tweet_ids[0])
         photos = extract_photo_urls(tweet)
 
         if not photos:
@@ -49,8 +48,8 @@ class PostTweetMedia(commands.Cog):
 
         logger.info(f'{get_tweet_url(tweet)} sent to #{ctx.channel.name} in {ctx.guild.name}')
 
-        for photo in photos[1:]:
-            await ctx.channel.send(photo)
+        for message in pack_lines(photos[1:]):
+            await ctx.channel.send(message)
 
     @commands.command()
     async def video(self, ctx, twitter_url: str):
@@ -60,7 +59,7 @@ class PostTweetMedia(commands.Cog):
             await ctx.channel.send("Message does not contain a Twitter link!")
             return
 
-        tweet = get_tweet(tweet_ids[0])
+        tweet = await get_tweet_async(tweet_ids[0])
         video = extract_video_url(tweet)
 
         if video is None:
@@ -80,15 +79,14 @@ class PostTweetMedia(commands.Cog):
         tweet = None
 
         try:
-            tweet = get_tweet(tweet_id)
+            tweet = await get_tweet_async(tweet_id)
         except TweepError:
             await ctx.channel.send(f'Tweet ID {tweet_id} is not valid!')
 
         if is_quote(tweet):
-            quoted_tweet = get_tweet(tweet.quoted_status.id)
+            quoted_tweet = await get_tweet_async(tweet.quoted_status.id)
 
-            for embed in get_tweet_embeds(quoted_tweet):
-                await ctx.channel.send(embed=embed)
+            await send_embeds(self.bot.http, ctx.channel.id, await get_tweet_embeds(quoted_tweet))
 
             video = extract_video_url(tweet.quoted_status)
 
@@ -107,7 +105,7 @@ class PostTweetMedia(commands.Cog):
         cleaned_message = clean_message(message.content)
 
         for tweet_id in get_tweet_ids(cleaned_message):
-            tweet = get_tweet(int(tweet_id))
+            tweet = await get_tweet_async(int(tweet_id))
             video_url = extract_video_url(tweet)
 
             if video_url:
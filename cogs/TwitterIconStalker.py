@@ -3,7 +3,7 @@ import logging
 from discord.ext import commands
 
 from utils.discord_embed_twitter_utils import get_user_embed
-from utils.twitter_utils import get_user
+from utils.twitter_utils import get_user_async
 
 logger = logging.getLogger(__name__)
 
@@ -14,13 +14,13 @@ class TwitterIconStalker(commands.Cog):
 
     @commands.command()
     async def user(self, ctx, screen_name):
-        user = get_user(screen_name=screen_name)
+        user = await get_user_async(screen_name=screen_name)
 
         if user is None:
             await ctx.channel.send(f'User @{screen_name} does not exist!')
             return
 
-        embed = get_user_embed(user)
+        embed = await get_user_embed(user)
 
         await ctx.channel.send(embed=embed)
         logger.info(f'User @{screen_name} sent to channel #{ctx.channel.name} in {ctx.guild.name}')
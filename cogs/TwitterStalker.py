@@ -2,75 +2,189 @@ import asyncio
 import json
 import logging
 import os
+import time
+from copy import deepcopy
 from datetime import datetime, timezone
+from functools import partial
 from math import ceil
-from queue import Queue
-from threading import Event, Thread
+from threading import Thread
 
 import discord
 import tweepy
-from aiohttp import ClientConnectorError
+from discord import Embed
 from discord.ext import commands, tasks
 from tweepy import TweepError
 
+from utils.cache_utils import LRUCache
+from utils.catchup_utils import get_resumable_user_ids, get_tweets_since
 from utils.discord_embed_twitter_utils import get_tweet_embeds, get_color_embed
-from utils.twitter_utils import get_tweet_url, get_tweepy, get_user, is_reply, is_retweet, get_tweet, \
-    extract_displayed_video_url, get_timeline, get_mock_tweet, extract_visible_id
+from utils.discord_utils import send_embeds, pack_embeds, pack_lines
+from utils.queue_utils import SpillQueue
+from utils.rate_limit_utils import TokenBucket
+from utils.retry_utils import get_retry_scheduler
+from utils.subscription_utils import SubscriptionRegistry, CHANNEL_OPTIONS
+from utils.tweet_history_utils import TweetHistory, TweetHistoryEntry
+from utils.twitter_stream_utils import StreamRestartController
+from utils.twitter_utils import get_tweet_url, get_stream_auths, get_user_async, is_retweet, get_tweet_async, \
+    extract_displayed_video_url, get_timeline_async, get_mock_tweet, extract_visible_id, get_tweets_async, \
+    normalize_tweet, has_media, serialize_tweet, deserialize_tweet, MAX_LOOKUP_SIZE
 from utils.url_utils import get_tweet_ids
+from utils.worker_utils import ChannelWorkerPool
 from utils.utils import format_time_delta
 
 logger = logging.getLogger(__name__)
 
+HYDRATION_WINDOW_SECONDS = 0.5
+CATCHUP_CONCURRENCY = 8
+CATCHUP_PAGE_SIZE = 200
+CATCHUP_MAX_PAGES = 5
+# user_timeline allows 900 requests per 15 minutes. A full burst plus 15 minutes of refill is 100 + 0.7 * 900 = 730,
+# and archive draws from the same bucket
+CATCHUP_REQUESTS_PER_SECOND = 0.7
+CATCHUP_BURST = 100
+EMBED_CACHE_SIZE = 200
+RETWEET_COALESCE_SECONDS = 5.0
+SENT_TWEETS_MAX_SIZE = 20000
+SENT_TWEETS_TTL_SECONDS = 7 * 24 * 60 * 60
+TWEET_HISTORY_MAX_SIZE_PER_CHANNEL = 2000
+TWEET_HISTORY_TTL_SECONDS = 14 * 24 * 60 * 60
+# Sends in flight across all channels, keeps bursts to many channels under Discord's global rate limit
+SEND_MAX_CONCURRENCY = 10
+# Tweets held in memory before the rest of a backlog (e.g. while Discord is down) spills to disk
+TWEET_QUEUE_MAX_SIZE = 2000
+SHUTDOWN_DRAIN_SECONDS = 15.0
+
 
 class DiscordRepostListener(tweepy.StreamListener):
-    def __init__(self, tweet_queue, restart_flag):
+    def __init__(self, tweet_queue, restart_controller, loop, accept_tweet):
         super().__init__()
         self.tweet_queue = tweet_queue
-        self.restart_flag = restart_flag
+        self.accept_tweet = accept_tweet
+        self.loop = loop
+        self.restart_controller = restart_controller
+        self.reported_failure = False
 
     def on_connect(self):
         logger.info('Stream connected')
+        self.restart_controller.on_connect()
 
     def on_status(self, tweet):
-        self.tweet_queue.put(tweet)
+        # Runs on the stream thread, the tweet queue is not thread-safe so hand over to the event loop
+        if self.accept_tweet(tweet):
+            self.loop.call_soon_threadsafe(self.tweet_queue.put_nowait, tweet)
+
+    # Returning False stops tweepy's own reconnect loop, the restart controller owns reconnects and their backoff
 
     def on_error(self, status_code):
         logger.info(f'Stream error. Status code: {status_code}')
-        self.restart_flag.set()
+        self.reported_failure = True
+        self.restart_controller.request_restart(f'stream error {status_code}', status_code=status_code)
+        return False
 
     def on_timeout(self):
         logger.info('Stream timeout')
-        self.restart_flag.set()
+        self.reported_failure = True
+        self.restart_controller.request_restart('stream timeout', network_error=True)
+        return False
 
     def on_disconnect(self, notice):
         logger.info(f'Stream disconnected. Notice: {notice}')
-        self.restart_flag.set()
+        self.reported_failure = True
+        self.restart_controller.request_restart(f'stream disconnected: {notice}', network_error=True)
+        return False
+
+
+class StreamShard:
+    def __init__(self, shard_id, auth, tweet_queue, loop, accept_tweet):
+        self.shard_id = shard_id
+        self.auth = auth
+        self.tweet_queue = tweet_queue
+        self.loop = loop
+        self.accept_tweet = accept_tweet
+        self.restart_controller = StreamRestartController()
+        self.follow_ids = []
+        self.listener = None
+        self.stream = None
+        self.thread = None
+
+    def start(self, follow_ids):
+        self.follow_ids = follow_ids
+
+        if not follow_ids:
+            logger.info(f'Stream shard {self.shard_id} has nobody to follow, not starting')
+            return
+
+        self.listener = DiscordRepostListener(tweet_queue=self.tweet_queue, restart_controller=self.restart_controller,
+                                              loop=self.loop, accept_tweet=self.accept_tweet)
+        self.stream = tweepy.Stream(auth=self.auth, listener=self.listener)
+        self.thread = Thread(target=self.run)
+        self.thread.start()
+        logger.info(f'Stream shard {self.shard_id} started! Now stalking IDs: {follow_ids}')
+
+    def run(self):
+        try:
+            self.stream.filter(follow=self.follow_ids)
+        except:
+            logger.info(f'Stream shard {self.shard_id} crashed')
+        finally:
+            # kill clears the listener first, so this only fires when the stream died on its own without the
+            # listener already having asked for a restart with the right backoff
+            listener = self.listener
+            if listener is not None and not listener.reported_failure:
+                self.restart_controller.request_restart('stream terminated', network_error=True)
+            logger.info(f'Stream shard {self.shard_id} terminated, awaiting restart...')
+
+    def kill(self):
+        self.listener = None
+
+        if self.stream:
+            self.stream.disconnect()
+        if self.thread:
+            self.thread.join()
+
+        self.stream = None
+        self.thread = None
+        logger.info(f'Stream shard {self.shard_id} killed!')
 
 
 class TwitterStalker(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.tweet_queue = Queue()
-        self.restart_flag = Event()
-        self.listener = None
-        self.stream = None
-        self.stream_thread = None
-        self.stalk_destinations = {}
-        self.stalk_users = {}
+        self.tweet_queue = SpillQueue(max_size=TWEET_QUEUE_MAX_SIZE,
+                                      spill_path=os.path.join(os.getcwd(), 'data', 'tweet_queue.jsonl'),
+                                      serialize=serialize_tweet, deserialize=deserialize_tweet)
+        self.discord_poster_task = None
+        self.stream_shards = []
+        self.subscriptions = SubscriptionRegistry()
         self.colors = {}
         self.stalk_start_time = {}
         self.startup_time = datetime.now(timezone.utc)
-        self.last_catchup = datetime.now(timezone.utc)
-        self.tweet_history = {}
-        self.sent_tweets = set()
+        self.tweet_history = TweetHistory(max_size_per_channel=TWEET_HISTORY_MAX_SIZE_PER_CHANNEL,
+                                          ttl=TWEET_HISTORY_TTL_SECONDS,
+                                          db_path=os.path.join(os.getcwd(), 'data', 'history.db'))
+        self.sent_tweets = LRUCache(max_size=SENT_TWEETS_MAX_SIZE, ttl=SENT_TWEETS_TTL_SECONDS)
+        self.embed_cache = LRUCache(max_size=EMBED_CACHE_SIZE)
+        self.pending_retweets = {}
+        self.in_flight_tweets = []
+        self.hydrations = 0
+        self.hydrations_skipped = 0
+        self.hydrations_saved = 0
+        self.dropped_at_ingest = 0
+        self.last_seen_ids = {}
+        self.retry_scheduler = get_retry_scheduler()
+        self.channel_workers = ChannelWorkerPool(max_concurrency=SEND_MAX_CONCURRENCY)
+        self.catchup_rate_limit = TokenBucket(rate=CATCHUP_REQUESTS_PER_SECOND, capacity=CATCHUP_BURST)
 
         self.load_destinations()
         self.load_colors()
+        self.load_last_seen_ids()
         self.setup_stalked_users()
 
         self.start_stream()
-        self.discord_poster.start()
+        self.discord_poster_task = self.bot.loop.create_task(self.discord_poster())
+        self.startup_catchup_task = self.bot.loop.create_task(self.startup_catchup())
         self.stream_restarter.start()
+        self.history_flusher.start()
 
     @commands.command()
     @commands.is_owner()
@@ -90,7 +204,7 @@ class TwitterStalker(commands.Cog):
                 screen_names = args
 
         for screen_name in screen_names:
-            user = get_user(screen_name=screen_name)
+            user = await get_user_async(screen_name=screen_name)
 
             if not user:
                 await ctx.channel.send(f'@{screen_name} is not a valid Twitter username!')
@@ -98,13 +212,13 @@ class TwitterStalker(commands.Cog):
 
             user_id = user.id_str
 
-            if user_id not in self.stalk_destinations:
-                self.stalk_destinations[user_id] = []
-                self.stalk_start_time[user_id] = datetime.now(timezone.utc)
-                self.restart_flag.set()
+            is_new_user = user_id not in self.subscriptions
+
+            if self.subscriptions.add(user_id, ctx.channel.id):
+                if is_new_user:
+                    self.stalk_start_time[user_id] = datetime.now(timezone.utc)
+                    self.get_stream_shard(user_id).restart_controller.request_restart(f'stalked {user_id}')
 
-            if ctx.channel.id not in self.stalk_destinations[user_id]:
-                self.stalk_destinations[user_id].append(ctx.channel.id)
                 if time:
                     logger.info(f'Stalked @{user.screen_name} in #{ctx.channel.name} in {ctx.guild.name} for {time} minutes')
                     await ctx.channel.send(f'Stalked @{user.screen_name} in this channel! Will auto-unstalk after {time} minutes.')
@@ -115,12 +229,6 @@ class TwitterStalker(commands.Cog):
                 await ctx.channel.send(f'@{user.screen_name} is already being stalked in this channel!')
                 return
 
-            if ctx.channel.id not in self.stalk_users:
-                self.stalk_users[ctx.channel.id] = []
-                self.tweet_history[ctx.channel.id] = {}
-
-            self.stalk_users[ctx.channel.id].append(user_id)
-
             if time:
                 asyncio.run_coroutine_threadsafe(self.auto_unstalk(ctx, user.screen_name, time), self.bot.loop)
 
@@ -135,7 +243,7 @@ class TwitterStalker(commands.Cog):
         await self.do_unstalk(ctx, screen_name, timed=True)
 
     async def do_unstalk(self, ctx, screen_name: str, timed: bool):
-        user = get_user(screen_name=screen_name)
+        user = await get_user_async(screen_name=screen_name)
 
         if not user:
             await ctx.channel.send(f'@{screen_name} is not a valid Twitter username!')
@@ -143,50 +251,111 @@ class TwitterStalker(commands.Cog):
 
         user_id = user.id_str
 
-        if not timed and (
-                user_id not in self.stalk_destinations or ctx.channel.id not in self.stalk_destinations[user_id]):
-            await ctx.channel.send(f'@{user.screen_name} (ID: {user_id}) is not being stalked in this channel!')
+        if not self.subscriptions.remove(user_id, ctx.channel.id):
+            if not timed:
+                await ctx.channel.send(f'@{user.screen_name} (ID: {user_id}) is not being stalked in this channel!')
             return
 
-        self.stalk_destinations[user_id].remove(ctx.channel.id)
-
-        if not self.stalk_destinations[user_id]:
-            del self.stalk_destinations[user_id]
+        if user_id not in self.subscriptions:
             del self.stalk_start_time[user_id]
-            self.restart_flag.set()
+            self.last_seen_ids.pop(user_id, None)
+            self.get_stream_shard(user_id).restart_controller.request_restart(f'unstalked {user_id}')
 
         logger.info(f'Unstalked @{user.screen_name} in #{ctx.channel.name} in {ctx.guild.name}')
         await ctx.channel.send(f'Unstalked @{user.screen_name} in this channel!')
 
-        self.stalk_users[ctx.channel.id].remove(user_id)
-
-        if not self.stalk_users[ctx.channel.id]:
-            del self.stalk_users[ctx.channel.id]
-            del self.tweet_history[ctx.channel.id]
+        if not self.subscriptions.snapshot.get_users(ctx.channel.id):
+            self.tweet_history.remove_channel(ctx.channel.id)
 
     @commands.command()
     async def stalks(self, ctx):
-        try:
-            stalk_names = [f'@{get_user(user_id=user_id).screen_name}' for user_id in self.stalk_users[ctx.channel.id]]
-        except KeyError:
+        user_ids = self.subscriptions.snapshot.get_users(ctx.channel.id)
+
+        if not user_ids:
             await ctx.channel.send('No users stalked in this channel!')
             return
 
+        users = await asyncio.gather(*[get_user_async(user_id=user_id) for user_id in user_ids])
+
+        stalk_names = [f'@{user.screen_name}' for user in users]
+
         await ctx.channel.send(f'Users stalked in this channel: {", ".join(stalk_names)}')
 
+    @commands.command()
+    @commands.is_owner()
+    async def options(self, ctx, option: str = None):
+        if option is None:
+            enabled = self.subscriptions.snapshot.options.get(ctx.channel.id, frozenset())
+            await ctx.channel.send(f'Options for this channel: {", ".join(sorted(enabled)) or "none"} '
+                                   f'(available: {", ".join(CHANNEL_OPTIONS)})')
+            return
+
+        if option not in CHANNEL_OPTIONS:
+            await ctx.channel.send(f'{option} is not a valid option! Available: {", ".join(CHANNEL_OPTIONS)}')
+            return
+
+        enabled = option not in self.subscriptions.snapshot.options.get(ctx.channel.id, frozenset())
+        self.subscriptions.set_option(ctx.channel.id, option, enabled)
+        self.save_destinations()
+
+        await ctx.channel.send(f'{"Enabled" if enabled else "Disabled"} {option} in this channel!')
+
     @commands.command()
     @commands.is_owner()
     async def queue(self, ctx, url: str):
         tweet_id = get_tweet_ids(url)[0]
-        tweet = get_tweet(tweet_id)
+        tweet = await get_tweet_async(tweet_id)
+
+        # Asked for explicitly, so posted again even if it already went out
+        queued_tweet = get_mock_tweet(tweet.user.id, tweet_id)
+        queued_tweet.repost = True
 
-        self.tweet_queue.put(get_mock_tweet(tweet.user.id, tweet_id))
+        self.tweet_queue.put_nowait(queued_tweet)
         await ctx.channel.send(f'Queued tweet {tweet_id}!')
 
+    @commands.command()
+    @commands.is_owner()
+    async def twitterstats(self, ctx):
+        stats = {
+            'Tweet queue': self.tweet_queue.stats(),
+            'Embed cache': self.embed_cache.stats(),
+            'Sent tweets': self.sent_tweets.stats(),
+            'Tweet history': self.tweet_history.stats(),
+            'Channel workers': self.channel_workers.stats(),
+            'Retries': {'twitter': self.retry_scheduler.stats('twitter'),
+                        'hydration': self.retry_scheduler.stats('hydration')},
+            'Hydration': {'looked_up': self.hydrations, 'skipped': self.hydrations_skipped,
+                          'dropped_at_ingest': self.dropped_at_ingest, 'saved_by_routing': self.hydrations_saved},
+        }
+
+        for shard in self.stream_shards:
+            stats[f'Stream shard {shard.shard_id}'] = {'follows': len(shard.follow_ids),
+                                                       **shard.restart_controller.stats()}
+
+        await ctx.channel.send('\n'.join(f'{name}: {value}' for name, value in stats.items()))
+
+    @commands.command()
+    @commands.is_owner()
+    async def restarts(self, ctx):
+        records = [(shard.shard_id, record) for shard in self.stream_shards for record in shard.restart_controller.history]
+        records = sorted(records, key=lambda x: x[1].started_at)[-10:]
+
+        if not records:
+            await ctx.channel.send('Stream has not been restarted yet!')
+            return
+
+        lines = []
+        for shard_id, record in records:
+            blind_time = f'{record.blind_seconds:.1f}s' if record.blind_seconds is not None else 'still reconnecting'
+            lines.append(f'Shard {shard_id} blind for {blind_time}: {", ".join(record.reasons)}')
+
+        for message in pack_lines(lines):
+            await ctx.channel.send(message)
+
     @commands.command()
     @commands.is_owner()
     async def color(self, ctx, screen_name: str, hex_code: str = None):
-        user = get_user(screen_name=screen_name)
+        user = await get_user_async(screen_name=screen_name)
 
         if not hex_code:
             user_color = self.colors.get(user.id_str)
@@ -215,27 +384,65 @@ class TwitterStalker(commands.Cog):
     async def tweet_stream_monitoring(self):
         await self.catchup(should_restart=True)
 
-    async def catchup(self, should_restart=False):
-        if (datetime.now(timezone.utc) - self.last_catchup).total_seconds() < 60:
-            await asyncio.sleep(60)
+    async def catchup(self, should_restart=False, user_ids=None):
+        semaphore = asyncio.Semaphore(CATCHUP_CONCURRENCY)
 
-        tweets = []
+        async def catchup_user(user_id):
+            async with semaphore:
+                return await self.get_missed_tweets(user_id)
 
-        for user_id in self.stalk_destinations:
-            for tweet in get_timeline(user_id):
-                if tweet.created_at.astimezone(timezone.utc) > max(self.startup_time, self.stalk_start_time[user_id]) and tweet.id not in self.sent_tweets:
-                    tweets.append(get_mock_tweet(user_id, tweet.id, tweet.created_at))
-            await asyncio.sleep(1)
+        if user_ids is None:
+            user_ids = list(self.subscriptions.snapshot.destinations)
+        results = await asyncio.gather(*[catchup_user(user_id) for user_id in user_ids], return_exceptions=True)
+
+        tweets = []
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Exception):
+                logger.info(f'Could not catch up on user {user_id}: {result}')
+            else:
+                tweets.extend(result)
 
         tweets.sort(key=lambda x: x.created_at)
         for tweet in tweets:
-            self.tweet_queue.put(tweet)
+            self.tweet_queue.put_nowait(tweet)
 
         if tweets and should_restart:
             logger.info('Detected missing tweets, restarting stream...')
-            self.restart_flag.set()
+            for user_id in {tweet.user.id_str for tweet in tweets}:
+                self.get_stream_shard(user_id).restart_controller.request_restart(f'catchup found missing tweets from {user_id}')
+
+    async def startup_catchup(self):
+        # The stream only covers from now on, fetch whatever was posted while the bot was down
+        await self.bot.wait_until_ready()
+
+        user_ids = get_resumable_user_ids(self.last_seen_ids, list(self.subscriptions.snapshot.destinations))
+        logger.info(f'Catching up on {len(user_ids)} users since their last seen tweets')
+        await self.catchup(user_ids=user_ids)
+
+    async def get_missed_tweets(self, user_id):
+        last_seen_id = self.last_seen_ids.get(user_id)
+
+        if last_seen_id is None:
+            # Never delivered anything for this user, only look at what was posted since we started stalking
+            await self.catchup_rate_limit.acquire()
+            timeline = await get_timeline_async(user_id)
+
+            if timeline:
+                self.update_last_seen_id(user_id, max(tweet.id for tweet in timeline))
+
+            return [get_mock_tweet(user_id, tweet.id, tweet.created_at) for tweet in timeline
+                    if tweet.created_at.replace(tzinfo=timezone.utc) > self.stalk_start_time[user_id]
+                    and tweet.id not in self.sent_tweets]
 
-        self.last_catchup = datetime.now(timezone.utc)
+        missed_tweets = await get_tweets_since(get_timeline_async, user_id, last_seen_id, self.catchup_rate_limit,
+                                               page_size=CATCHUP_PAGE_SIZE, max_pages=CATCHUP_MAX_PAGES,
+                                               skip_ids=self.sent_tweets)
+
+        return [get_mock_tweet(user_id, tweet.id, tweet.created_at) for tweet in missed_tweets]
+
+    def update_last_seen_id(self, user_id, tweet_id):
+        if tweet_id > self.last_seen_ids.get(user_id, 0):
+            self.last_seen_ids[user_id] = tweet_id
 
     @commands.command()
     async def archive(self, ctx, screen_name):
@@ -243,7 +450,7 @@ class TwitterStalker(commands.Cog):
             logger.info(f'Illegal access from channel #{ctx.channel.name} in {ctx.guild.name}')
             return
 
-        user = get_user(screen_name=screen_name)
+        user = await get_user_async(screen_name=screen_name)
 
         if not user:
             await ctx.channel.send(f'User @{screen_name} does not exist!')
@@ -253,7 +460,7 @@ class TwitterStalker(commands.Cog):
             return
 
         logger.info(f'Archiving @{screen_name}')
-        if user.id in self.stalk_destinations and len(self.stalk_destinations[user.id_str]) > 1:
+        if len(self.subscriptions.snapshot.get_channels(user.id_str)) > 1:
             logger.info("Aborting, user stalked in another channel")
             return
 
@@ -268,7 +475,8 @@ class TwitterStalker(commands.Cog):
 
         max_id = None
         for _ in range(num_fetches):
-            for tweet in get_timeline(user.id, 200, max_id):
+            await self.catchup_rate_limit.acquire()
+            for tweet in await get_timeline_async(user.id, 200, max_id):
                 tweets.append(tweet)
                 tweets_json.append(tweet._json)
 
@@ -284,161 +492,384 @@ class TwitterStalker(commands.Cog):
         logger.info(f'Archiving @{screen_name} complete')
         os.remove(temp_file_name)
 
-    @tasks.loop(seconds=1.0)
     async def discord_poster(self):
-        while not self.tweet_queue.empty():
-            short_tweet = self.tweet_queue.get()
-            user_id = short_tweet.user.id_str
-
-            if user_id not in self.stalk_destinations:
-                continue
+        await self.bot.wait_until_ready()
 
+        while True:
             try:
-                extended_tweet = get_tweet(short_tweet.id)
-            except TweepError:
-                self.handle_posting_error(error_tweet=short_tweet)
+                short_tweets = await self.collect_hydration_batch()
+
+                extended_tweets = await self.hydrate(short_tweets)
+                self.in_flight_tweets = []
+
+                for extended_tweet in extended_tweets:
+                    await self.post_tweet(extended_tweet)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Unexpected error while posting tweets')
+
+    async def collect_hydration_batch(self):
+        # Sleeps until the stream, catchup or a command hands over a tweet
+        first_tweet = await self.tweet_queue.get()
+
+        batch = [first_tweet] if self.accept_tweet(first_tweet) else []
+        # Only in flight until hydrate hands it over to the channel workers, kept so shutdown can persist it
+        self.in_flight_tweets = batch
+        batch.extend(self.drain_tweet_queue(MAX_LOOKUP_SIZE - len(batch)))
+
+        if len(batch) < MAX_LOOKUP_SIZE and not all(normalize_tweet(tweet) for tweet in batch):
+            # Give a burst (e.g. from catchup) a moment to arrive so that it shares one lookup call
+            await asyncio.sleep(HYDRATION_WINDOW_SECONDS)
+            batch.extend(self.drain_tweet_queue(MAX_LOOKUP_SIZE - len(batch)))
+
+        return batch
+
+    def drain_tweet_queue(self, max_tweets):
+        tweets = []
+
+        while len(tweets) < max_tweets and not self.tweet_queue.empty():
+            short_tweet = self.tweet_queue.get_nowait()
+
+            if self.accept_tweet(short_tweet):
+                tweets.append(short_tweet)
+
+        return tweets
+
+    def accept_tweet(self, short_tweet):
+        # Routing only needs fields that every stream payload has, so nobody's tweets are looked up just to be dropped
+        if self.route_tweet(short_tweet):
+            return True
+
+        self.dropped_at_ingest += 1
+        if not normalize_tweet(short_tweet):
+            self.hydrations_saved += 1
+
+        return False
+
+    def route_tweet(self, tweet):
+        # Also called from the stream threads, so only ever read one published snapshot
+        subscriptions = self.subscriptions.snapshot
+
+        # Mock tweets don't know what they are yet, those are routed again once hydrated
+        if not hasattr(tweet, '_json'):
+            channel_ids = subscriptions.get_channels(tweet.user.id_str)
+        else:
+            media = has_media(tweet) if normalize_tweet(tweet) else None
+            channel_ids = subscriptions.route(tweet.user.id_str, in_reply_to_user_id=tweet.in_reply_to_user_id_str,
+                                              retweet=is_retweet(tweet), media=media)
+
+        # Tweets replayed after a shutdown that had already reached some of their channels
+        if hasattr(tweet, 'channel_ids'):
+            return [channel_id for channel_id in channel_ids if channel_id in tweet.channel_ids]
+
+        return channel_ids
+
+    async def hydrate(self, short_tweets):
+        # Complete stream payloads are posted as they are, only truncated and mock tweets are looked up
+        truncated_tweets = [short_tweet for short_tweet in short_tweets if not normalize_tweet(short_tweet)]
+        self.hydrations_skipped += len(short_tweets) - len(truncated_tweets)
+
+        if not truncated_tweets:
+            return short_tweets
+
+        try:
+            extended_tweets = await get_tweets_async([short_tweet.id for short_tweet in truncated_tweets])
+        except TweepError as e:
+            self.handle_posting_error(truncated_tweets, e)
+            return [short_tweet for short_tweet in short_tweets if short_tweet not in truncated_tweets]
+
+        self.hydrations += len(truncated_tweets)
+        extended_tweets_by_id = {extended_tweet.id: extended_tweet for extended_tweet in extended_tweets}
+        hydrated_tweets = []
+        missing_tweets = []
+
+        for short_tweet in short_tweets:
+            if short_tweet not in truncated_tweets:
+                hydrated_tweets.append(short_tweet)
                 continue
 
-            self.sent_tweets.add(extended_tweet.id)
+            # Tweets queued by command have string IDs
+            extended_tweet = extended_tweets_by_id.get(int(short_tweet.id))
+
+            if extended_tweet:
+                if hasattr(short_tweet, 'channel_ids'):
+                    extended_tweet.channel_ids = short_tweet.channel_ids
+                if hasattr(short_tweet, 'repost'):
+                    extended_tweet.repost = short_tweet.repost
+                if hasattr(short_tweet, 'hydration_attempts'):
+                    self.retry_scheduler.count('hydration', 'recovered')
+                hydrated_tweets.append(extended_tweet)
+            else:
+                missing_tweets.append(short_tweet)
 
-            for channel_id in self.stalk_destinations[user_id]:
-                if not self.is_relevant(extended_tweet, channel_id):
-                    continue
+        if missing_tweets:
+            self.handle_posting_error(missing_tweets, LookupError('Not found'))
 
-                if is_retweet(extended_tweet) and extract_visible_id(extended_tweet) in self.tweet_history[channel_id]:
-                    await self.handle_posted_retweet(extended_tweet, channel_id)
-                else:
-                    await self.handle_new_tweet(extended_tweet, channel_id)
+        return hydrated_tweets
 
-    def is_relevant(self, tweet, channel_id):
-        return not is_reply(tweet) or tweet.in_reply_to_user_id_str in self.stalk_users[channel_id]
+    async def post_tweet(self, extended_tweet):
+        user_id = extended_tweet.user.id_str
+
+        if user_id not in self.subscriptions:
+            return
+
+        # Catchup and tweets replayed from the last run can both bring back the same tweet
+        if extended_tweet.id in self.sent_tweets and not getattr(extended_tweet, 'repost', False):
+            return
+
+        self.sent_tweets[extended_tweet.id] = True
+        self.update_last_seen_id(user_id, extended_tweet.id)
+
+        # Each channel has its own ordered worker, so a slow or rate limited channel only holds up itself
+        for channel_id in self.route_tweet(extended_tweet):
+            self.channel_workers.submit(channel_id, partial(self.deliver_tweet, extended_tweet, channel_id),
+                                        item=extended_tweet)
+
+    async def deliver_tweet(self, tweet, channel_id):
+        # Checked here rather than on submit, since the original may still be queued ahead of its retweet
+        if is_retweet(tweet) and await self.tweet_history.get(channel_id, extract_visible_id(tweet)):
+            await self.handle_posted_retweet(tweet, channel_id)
+        else:
+            await self.handle_new_tweet(tweet, channel_id)
 
     async def handle_new_tweet(self, tweet, channel_id):
         user_id = tweet.user.id_str
-        embeds = get_tweet_embeds(tweet, color=self.colors.get(user_id))
+        embeds = await self.render_tweet_embeds(tweet, color=self.colors.get(user_id))
         video_url = extract_displayed_video_url(tweet)
 
+        # Only this channel's send is retried, in place so the channel's later tweets wait behind it
+        await self.retry_scheduler.call('twitter', f'send {tweet.id} to {channel_id}',
+                                        partial(self.send_new_tweet, tweet, channel_id, embeds, video_url))
+
+    async def send_new_tweet(self, tweet, channel_id, embeds, video_url):
         channel = self.bot.get_channel(channel_id)
+        message_ids = await send_embeds(self.bot.http, channel_id, embeds)
+
+        if video_url:
+            await channel.send(video_url)
+
+        main_message_embeds = pack_embeds(embeds)[0]
+        self.tweet_history.put(channel_id, extract_visible_id(tweet),
+                               TweetHistoryEntry(main_message_id=message_ids[0],
+                                                 timestamp_message_id=message_ids[-1],
+                                                 embeds=[embed.to_dict() for embed in main_message_embeds],
+                                                 timestamp=embeds[-1].timestamp))
+
+        logger.info(f'{get_tweet_url(tweet)} sent to channel #{channel.name} in {channel.guild.name}')
+
+    async def render_tweet_embeds(self, tweet, color: int = None):
+        key = (tweet.id, color)
+        render_task = self.embed_cache.get(key)
+
+        if render_task is None:
+            # Cache the task rather than the result so that channels rendering concurrently share one render
+            render_task = asyncio.ensure_future(get_tweet_embeds(tweet, color=color))
+            self.embed_cache[key] = render_task
 
         try:
-            main_discord_message = await channel.send(embed=embeds[0])
+            embeds = await asyncio.shield(render_task)
+        except Exception:
+            self.embed_cache.pop(key)
+            raise
 
-            if len(embeds) == 1:
-                timestamp_discord_message = main_discord_message
-            else:
-                for embed in embeds[1:-1]:
-                    await channel.send(embed=embed)
-                timestamp_discord_message = await channel.send(embed=embeds[-1])
+        return [embed.copy() for embed in embeds]
 
-            if video_url:
-                await channel.send(video_url)
+    async def handle_posted_retweet(self, tweet, channel_id):
+        key = (channel_id, extract_visible_id(tweet))
 
-            self.tweet_history[channel_id][extract_visible_id(tweet)] = (main_discord_message.id, timestamp_discord_message.id)
-        except ClientConnectorError:
-            self.tweet_queue.put(tweet)
-            logger.info(f'Could not connect to client, requeueing tweet {tweet.id}')
+        if key in self.pending_retweets:
+            self.pending_retweets[key].append(tweet)
             return
 
-        logger.info(f'{get_tweet_url(tweet)} sent to channel #{channel.name} in {channel.guild.name}')
+        # Retweets of the same tweet tend to arrive in bursts, so wait a bit and merge them in a single edit
+        self.pending_retweets[key] = [tweet]
+        self.bot.loop.create_task(self.merge_pending_retweets(key))
 
-    async def handle_posted_retweet(self, tweet, channel_id):
+    async def merge_pending_retweets(self, key):
+        await asyncio.sleep(RETWEET_COALESCE_SECONDS)
+        channel_id, visible_id = key
+        tweets = self.pending_retweets.pop(key)
+
+        await self.retry_scheduler.call('twitter', f'merge {len(tweets)} retweets of {visible_id} in {channel_id}',
+                                        partial(self.merge_retweets, channel_id, visible_id, tweets))
+
+    async def merge_retweets(self, channel_id, visible_id, tweets):
         RETWEETED_BY_FIELD_NAME = 'Retweeted by'
 
         channel = self.bot.get_channel(channel_id)
-        main_message_id, timestamp_message_id = self.tweet_history[channel_id][extract_visible_id(tweet)]
-        main_message = await channel.fetch_message(main_message_id)
+        history_entry = await self.tweet_history.get(channel_id, visible_id)
+
+        if history_entry.embeds is not None and history_entry.timestamp is not None:
+            # The payload is deep copied since editing the embed mutates its fields list
+            original_embed = Embed.from_dict(deepcopy(history_entry.embeds[0]))
+            other_embeds = history_entry.embeds[1:]
+            timestamp = history_entry.timestamp
+        else:
+            # Entries written before embeds were cached
+            main_message = await channel.fetch_message(history_entry.main_message_id)
+            original_embed = main_message.embeds[0]
+            other_embeds = [embed.to_dict() for embed in main_message.embeds[1:]]
 
-        original_embed = main_message.embeds[0]
+            timestamp_message = await channel.fetch_message(history_entry.timestamp_message_id)
+            timestamp = timestamp_message.embeds[0].timestamp
+
+        # to_dict shares the fields list with the embed, so snapshot it before editing
+        original_payload = deepcopy(original_embed.to_dict())
         new_embed = original_embed
 
-        timestamp_message = await channel.fetch_message(timestamp_message_id)
-        td = tweet.created_at - timestamp_message.embeds[0].timestamp
-        str_appended = f'[@{tweet.user.name}]({get_tweet_url(tweet=tweet)}) ({format_time_delta(td)} later)'
+        field_idx = next((i for i, field in enumerate(original_embed.fields) if field.name == RETWEETED_BY_FIELD_NAME), None)
+        existing_value = original_embed.fields[field_idx].value if field_idx is not None else ''
 
-        found_flag = False
+        lines_appended = []
+        for tweet in tweets:
+            tweet_url = get_tweet_url(tweet=tweet)
 
-        for i in range(len(original_embed.fields)):
-            original_field = original_embed.fields[i]
+            # The same retweet can come in from both the stream and catchup
+            if tweet_url in existing_value or any(tweet_url in line for line in lines_appended):
+                continue
 
-            if original_field.name == RETWEETED_BY_FIELD_NAME:
-                found_flag = True
-                new_embed.set_field_at(i, name=RETWEETED_BY_FIELD_NAME,
-                                       value=f'{original_field.value}\n{str_appended}', inline=False)
+            td = tweet.created_at - timestamp
+            lines_appended.append(f'[@{tweet.user.name}]({tweet_url}) ({format_time_delta(td)} later)')
 
-        if not found_flag:
+        str_appended = '\n'.join(lines_appended)
+
+        if lines_appended and field_idx is not None:
+            new_embed.set_field_at(field_idx, name=RETWEETED_BY_FIELD_NAME,
+                                   value=f'{existing_value}\n{str_appended}', inline=False)
+        elif lines_appended:
             new_embed.add_field(name=RETWEETED_BY_FIELD_NAME, value=str_appended, inline=False)
 
-        await main_message.edit(embed=new_embed)
-        logger.info(f'Retweet {get_tweet_url(tweet)} sent to channel #{channel.name} in {channel.guild.name}')
+        if new_embed.to_dict() == original_payload:
+            logger.info(f'Skipping edit of tweet {visible_id} in channel #{channel.name}, nothing changed')
+            return
+
+        # The main message can hold several embeds, all of them have to be resent or the others are dropped
+        new_embeds = [new_embed.to_dict()] + other_embeds
+        await self.bot.http.edit_message(channel_id=channel_id, message_id=history_entry.main_message_id,
+                                         embeds=new_embeds)
+        self.tweet_history.put(channel_id, visible_id, history_entry._replace(embeds=new_embeds, timestamp=timestamp))
+
+        for tweet in tweets:
+            logger.info(f'Retweet {get_tweet_url(tweet)} sent to channel #{channel.name} in {channel.guild.name}')
+
+    def handle_posting_error(self, error_tweets, error):
+        # Put back on the queue together after the backoff, so they are looked up in batches again rather than
+        # one request each against an endpoint that may have just rate limited us
+        retry_tweets = []
+
+        for error_tweet in error_tweets:
+            error_tweet.hydration_attempts = getattr(error_tweet, 'hydration_attempts', 0) + 1
+            self.retry_scheduler.count('hydration', 'failed')
 
-    def handle_posting_error(self, error_tweet):
-        if hasattr(error_tweet, 'curr_retries'):
-            if error_tweet.curr_retries > 5:
-                error_username = get_user(user_id=error_tweet.user.id).name
-                logger.info(f'Failed to post tweet {error_tweet.id} from user {error_username}')
+            if error_tweet.hydration_attempts >= self.retry_scheduler.max_attempts:
+                self.retry_scheduler.dead_letter('hydration', f'hydrate {error_tweet.id}',
+                                                 error_tweet.hydration_attempts, error)
             else:
-                error_tweet.curr_retries += 1
-                self.tweet_queue.put(error_tweet)
-        else:
-            setattr(error_tweet, 'curr_retries', 1)
-            self.tweet_queue.put(error_tweet)
+                retry_tweets.append(error_tweet)
+
+        if retry_tweets:
+            attempt = max(retry_tweet.hydration_attempts for retry_tweet in retry_tweets)
+            self.retry_scheduler.defer('hydration', f'hydrate {len(retry_tweets)} tweets', attempt,
+                                       partial(self.requeue_tweets, retry_tweets), items=retry_tweets)
+
+    def requeue_tweets(self, tweets):
+        for tweet in tweets:
+            self.tweet_queue.put_nowait(tweet)
 
-    @tasks.loop(minutes=1.0)
+    @tasks.loop(seconds=5.0)
     async def stream_restarter(self):
-        if self.restart_flag.is_set():
-            logger.info('Restarting stream......')
-            self.kill_stream()
-            self.save_destinations()
-            await self.catchup()
-            self.start_stream()
-            self.restart_flag.clear()
-            logger.info('Stream restarted!')
+        for shard in self.stream_shards:
+            if shard.restart_controller.is_due():
+                await self.restart_stream_shard(shard)
 
-    def start_stream(self):
-        self.listener = DiscordRepostListener(tweet_queue=self.tweet_queue, restart_flag=self.restart_flag)
-        self.stream = tweepy.Stream(auth=get_tweepy().auth, listener=self.listener)
-        self.stream_thread = Thread(target=self.start_stream_thread)
-        self.stream_thread.start()
-        logger.info(f'Stream started! Now stalking IDs: {list(self.stalk_destinations)}')
+    async def restart_stream_shard(self, shard):
+        reasons = shard.restart_controller.start_restart()
+        logger.info(f'Restarting stream shard {shard.shard_id}...... Reasons: {reasons}')
 
-    def start_stream_thread(self):
+        await self.bot.loop.run_in_executor(None, shard.kill)
+        self.save_destinations()
+
+        follow_ids = self.get_shard_follow_ids(shard)
+        await self.catchup(user_ids=follow_ids)
+        shard.start(follow_ids)
+        logger.info(f'Stream shard {shard.shard_id} restarted!')
+
+    @tasks.loop(seconds=30.0)
+    async def history_flusher(self):
+        # An exception would stop the loop for good, after which nothing is written until unload
         try:
-            self.stream.filter(follow=list(self.stalk_destinations))
-        except:
-            logger.info('Stream crashed')
-        finally:
-            self.restart_flag.set()
-            logger.info('Stream terminated, awaiting restart...')
+            await self.bot.loop.run_in_executor(None, self.tweet_history.flush)
+        except Exception:
+            logger.exception('Failed to flush the tweet history')
 
-    def kill_stream(self):
-        self.listener = None
+        try:
+            self.save_last_seen_ids()
+        except Exception:
+            logger.exception('Failed to save the last seen tweet IDs')
 
-        if self.stream:
-            self.stream.disconnect()
-        self.stream_thread.join()
+    def start_stream(self):
+        self.stream_shards = [StreamShard(shard_id=shard_id, auth=auth, tweet_queue=self.tweet_queue, loop=self.bot.loop,
+                                          accept_tweet=self.accept_tweet)
+                              for shard_id, auth in enumerate(get_stream_auths())]
+
+        for shard in self.stream_shards:
+            shard.start(self.get_shard_follow_ids(shard))
+
+    def kill_stream(self):
+        for shard in self.stream_shards:
+            shard.kill()
 
-        self.stream = None
         logger.info('Stream killed!')
 
-    def restart_stream(self):
-        self.kill_stream()
-        self.start_stream()
+    def get_stream_shard(self, user_id):
+        # Stable assignment, so a follow set change only ever touches one shard
+        return self.stream_shards[int(user_id) % len(self.stream_shards)]
+
+    def get_shard_follow_ids(self, shard):
+        return [user_id for user_id in self.subscriptions.snapshot.destinations if self.get_stream_shard(user_id) is shard]
 
     def load_destinations(self):
         path = os.path.join(os.getcwd(), 'data', 'tweets.json')
         with open(path) as f:
-            self.stalk_destinations = json.load(f)
+            destinations = json.load(f)
+
+        try:
+            with open(os.path.join(os.getcwd(), 'data', 'channel_options.json')) as f:
+                options = json.load(f)
+        except FileNotFoundError:
+            options = {}
+
+        self.subscriptions.load(destinations, options)
 
     def load_colors(self):
         path = os.path.join(os.getcwd(), 'data', 'colors.json')
         with open(path) as f:
             self.colors = json.load(f)
 
+    def load_last_seen_ids(self):
+        path = os.path.join(os.getcwd(), 'data', 'last_seen.json')
+
+        try:
+            with open(path) as f:
+                self.last_seen_ids = json.load(f)
+        except FileNotFoundError:
+            self.last_seen_ids = {}
+
+    def save_last_seen_ids(self):
+        path = os.path.join(os.getcwd(), 'data', 'last_seen.json')
+        with open(path, 'w') as f:
+            json.dump(self.last_seen_ids, f, indent=4)
+
     def save_destinations(self):
         path = os.path.join(os.getcwd(), 'data', 'tweets.json')
         with open(path, 'w') as f:
             f.seek(0)
-            json.dump(self.stalk_destinations, f, indent=4)
+            json.dump(self.subscriptions.dump_destinations(), f, indent=4)
+
+        path = os.path.join(os.getcwd(), 'data', 'channel_options.json')
+        with open(path, 'w') as f:
+            json.dump(self.subscriptions.dump_options(), f, indent=4)
 
     def save_colors(self):
         path = os.path.join(os.getcwd(), 'data', 'colors.json')
@@ -447,22 +878,57 @@ class TwitterStalker(commands.Cog):
             json.dump(self.colors, f, indent=4)
 
     def setup_stalked_users(self):
-        for user_id in self.stalk_destinations:
+        for user_id in self.subscriptions.snapshot.destinations:
             self.stalk_start_time[user_id] = self.startup_time
-            for channel_id in self.stalk_destinations[user_id]:
-                if channel_id not in self.stalk_users:
-                    self.stalk_users[channel_id] = []
-                    self.tweet_history[channel_id] = {}
 
-                self.stalk_users[channel_id].append(user_id)
+    async def drain(self):
+        # Called by the bot on shutdown while Discord is still connected, gives whatever is queued a chance to go out
+        await self.bot.loop.run_in_executor(None, self.kill_stream)
+        self.stream_restarter.cancel()
+
+        deadline = time.monotonic() + SHUTDOWN_DRAIN_SECONDS
+
+        # Sends retry inside their channel's worker, so busy() covers those, hydration retries run on their own
+        while time.monotonic() < deadline and (not self.tweet_queue.empty() or self.in_flight_tweets
+                                               or self.channel_workers.busy() or self.pending_retweets
+                                               or self.retry_scheduler.has_pending('hydration')):
+            await asyncio.sleep(0.1)
+
+        logger.info(f'Drained tweets, {self.tweet_queue.qsize()} queued and '
+                    f'{self.channel_workers.queued()} deliveries still pending')
+
+    def persist_pending_tweets(self):
+        # Deliveries that didn't finish, including sends cut off while retrying, only go to the channels that are
+        # still missing them
+        undelivered_tweets = {}
+        for submitted_at, channel_id, tweet in self.channel_workers.cancel():
+            undelivered_tweets.setdefault(tweet.id, (tweet, []))[1].append(channel_id)
+
+        front_tweets = []
+        for tweet, channel_ids in undelivered_tweets.values():
+            tweet.channel_ids = channel_ids
+            front_tweets.append(tweet)
+
+        front_tweets.extend(self.in_flight_tweets)
+        # Tweets still waiting on a hydration retry never reached any channel
+        front_tweets.extend(self.retry_scheduler.cancel('hydration'))
+        persisted = self.tweet_queue.persist(front_items=front_tweets)
+
+        if persisted:
+            logger.info(f'Persisted {persisted} tweets, they will be posted first on the next start')
 
     def cog_unload(self):
         self.kill_stream()
-        self.discord_poster.cancel()
+        self.discord_poster_task.cancel()
+        self.startup_catchup_task.cancel()
         self.stream_restarter.cancel()
+        self.history_flusher.cancel()
+        self.persist_pending_tweets()
+        self.retry_scheduler.cancel('twitter')
         self.save_destinations()
+        self.save_last_seen_ids()
+        self.tweet_history.close()
 
-    @discord_poster.before_loop
     @stream_restarter.before_loop
     async def await_ready(self):
         await self.bot.wait_until_ready()
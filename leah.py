@@ -1,8 +1,11 @@
 import logging
+import signal
 
 from discord.ext import commands
 
 from utils.credentials_utils import get_credentials
+from utils.instagram_utils import close_insta_session
+from utils.url_utils import close_url_session
 
 formatter = '%(levelname)s %(name)s:%(lineno)d: %(asctime)s - %(message)s'
 logging.basicConfig(level=logging.INFO, format=formatter)
@@ -10,7 +13,28 @@ logging.basicConfig(level=logging.INFO, format=formatter)
 active_extensions = ['cogs.Admin', 'cogs.PostTweetMedia', 'cogs.TwitterStalker', 'cogs.PostTime',
                      'cogs.PostInstaMedia', 'cogs.TwitterIconStalker', 'cogs.PostYoutubeInfo']
 
-bot = commands.Bot(command_prefix='!!', description='placeholder')
+
+class LeahBot(commands.Bot):
+    async def close(self):
+        if self.is_closed():
+            return
+
+        # Cogs get to drain their queues while Discord is still connected, before they are unloaded
+        for cog in list(self.cogs.values()):
+            if hasattr(cog, 'drain'):
+                try:
+                    await cog.drain()
+                except Exception:
+                    logging.exception(f'Failed to drain {type(cog).__name__}')
+
+        await super().close()
+
+        # Shared by several cogs, so closed once here rather than when any one of them is unloaded
+        await close_insta_session()
+        await close_url_session()
+
+
+bot = LeahBot(command_prefix='!!', description='placeholder')
 
 @bot.event
 async def on_command_error(ctx, error):
@@ -22,4 +46,16 @@ for extension in active_extensions:
     bot.load_extension(extension)
 
 credentials = get_credentials('credentials.json')
-bot.run(credentials['discord']['token'])
+
+# bot.run() stops the loop on a signal, which cancels everything before close() can drain, so close first instead
+try:
+    bot.loop.add_signal_handler(signal.SIGINT, lambda: bot.loop.create_task(bot.close()))
+    bot.loop.add_signal_handler(signal.SIGTERM, lambda: bot.loop.create_task(bot.close()))
+except NotImplementedError:
+    pass
+
+try:
+    bot.loop.run_until_complete(bot.start(credentials['discord']['token']))
+finally:
+    bot.loop.run_until_complete(bot.close())
+    bot.loop.close()
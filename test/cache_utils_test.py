@@ -0,0 +1,59 @@
+import time
+import unittest
+
+from utils.cache_utils import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_get_and_set(self):
+        cache = LRUCache(max_size=2)
+        cache['a'] = 1
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_pop(self):
+        cache = LRUCache(max_size=2)
+        cache['a'] = 1
+
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_expires_after_ttl(self):
+        cache = LRUCache(max_size=2, ttl=0.01)
+        cache['a'] = 1
+        self.assertIn('a', cache)
+
+        time.sleep(0.02)
+        self.assertNotIn('a', cache)
+        self.assertIsNone(cache.get('a'))
+
+    def test_set_evicts_expired(self):
+        cache = LRUCache(max_size=10, ttl=0.01)
+        cache['a'] = 1
+        cache['b'] = 2
+
+        time.sleep(0.02)
+        cache['c'] = 3
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.evictions, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from collections import namedtuple
+
+from utils.catchup_utils import get_resumable_user_ids, get_tweets_since
+from utils.rate_limit_utils import TokenBucket
+
+Tweet = namedtuple('Tweet', ['id'])
+
+
+class FakeTimeline:
+    def __init__(self, tweet_ids):
+        self.tweet_ids = sorted(tweet_ids, reverse=True)
+        self.calls = []
+
+    async def __call__(self, user_id, count, max_id=None, since_id=None):
+        self.calls.append({'user_id': user_id, 'count': count, 'max_id': max_id, 'since_id': since_id})
+
+        tweet_ids = [tweet_id for tweet_id in self.tweet_ids
+                     if (since_id is None or tweet_id > since_id) and (max_id is None or tweet_id <= max_id)]
+        return [Tweet(tweet_id) for tweet_id in tweet_ids[:count]]
+
+
+class CatchupTest(unittest.TestCase):
+    def test_persisted_mark_requests_since_id_at_startup(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'last_seen.json')
+            with open(path, 'w') as f:
+                json.dump({'1': 105}, f)
+
+            with open(path) as f:
+                last_seen_ids = json.load(f)
+
+        timeline = FakeTimeline(range(100, 111))
+        user_ids = get_resumable_user_ids(last_seen_ids, ['1', '2'])
+
+        self.assertEqual(user_ids, ['1'])
+
+        tweets = asyncio.run(get_tweets_since(timeline, '1', last_seen_ids['1'], TokenBucket(rate=100, capacity=10),
+                                              page_size=200, max_pages=5))
+
+        self.assertEqual(timeline.calls[0]['since_id'], 105)
+        self.assertEqual([tweet.id for tweet in tweets], [110, 109, 108, 107, 106])
+
+    def test_pages_down_to_since_id(self):
+        timeline = FakeTimeline(range(100, 111))
+
+        tweets = asyncio.run(get_tweets_since(timeline, '1', 100, TokenBucket(rate=100, capacity=10),
+                                              page_size=4, max_pages=5, skip_ids={108}))
+
+        self.assertEqual([call['max_id'] for call in timeline.calls], [None, 106, 102])
+        self.assertEqual([tweet.id for tweet in tweets], [110, 109, 107, 106, 105, 104, 103, 102, 101])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from discord import Embed
+
+from utils.discord_utils import pack_embeds, pack_lines, MAX_EMBEDS_PER_MESSAGE, MAX_EMBED_CHARACTERS_PER_MESSAGE
+
+
+class PackEmbedsTest(unittest.TestCase):
+    def test_embed_limit(self):
+        embeds = [Embed(title=str(i)) for i in range(25)]
+
+        chunks = pack_embeds(embeds)
+
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        self.assertEqual([embed for chunk in chunks for embed in chunk], embeds)
+
+    def test_character_limit(self):
+        embeds = [Embed(description='a' * 2500) for i in range(5)]
+
+        chunks = pack_embeds(embeds)
+
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        for chunk in chunks:
+            self.assertLessEqual(sum(len(embed) for embed in chunk), MAX_EMBED_CHARACTERS_PER_MESSAGE)
+
+    def test_exactly_at_limits(self):
+        embeds = [Embed(description='a' * (MAX_EMBED_CHARACTERS_PER_MESSAGE // MAX_EMBEDS_PER_MESSAGE))
+                  for i in range(MAX_EMBEDS_PER_MESSAGE)]
+
+        self.assertEqual(pack_embeds(embeds), [embeds])
+
+    def test_single_embed_over_limit(self):
+        # Can't be split, goes out on its own and lets Discord decide
+        embeds = [Embed(title='before'), Embed(description='a' * (MAX_EMBED_CHARACTERS_PER_MESSAGE + 1)),
+                  Embed(title='after')]
+
+        self.assertEqual(pack_embeds(embeds), [[embeds[0]], [embeds[1]], [embeds[2]]])
+
+    def test_no_embeds(self):
+        self.assertEqual(pack_embeds([]), [])
+
+
+class PackLinesTest(unittest.TestCase):
+    def test_fits_in_one_message(self):
+        self.assertEqual(pack_lines(['a', 'b', 'c']), ['a\nb\nc'])
+
+    def test_length_cut_off(self):
+        # Two lines of 4 plus the newline between them make 9
+        self.assertEqual(pack_lines(['aaaa', 'bbbb', 'cccc'], max_length=9), ['aaaa\nbbbb', 'cccc'])
+        self.assertEqual(pack_lines(['aaaa', 'bbbb', 'cccc'], max_length=8), ['aaaa', 'bbbb', 'cccc'])
+
+    def test_messages_stay_under_limit(self):
+        lines = [f'line {i} ' + 'x' * (i % 50) for i in range(500)]
+
+        messages = pack_lines(lines)
+
+        self.assertTrue(all(len(message) <= 2000 for message in messages))
+        self.assertEqual('\n'.join(messages).split('\n'), lines)
+
+    def test_line_over_limit(self):
+        self.assertEqual(pack_lines(['a', 'b' * 10, 'c'], max_length=5), ['a', 'b' * 10, 'c'])
+
+    def test_no_lines(self):
+        self.assertEqual(pack_lines([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from utils.instagram_utils import find_new_posts, get_post_state
+
+
+def make_timeline(*posts):
+    return {'edge_owner_to_timeline_media': {
+        'count': len(posts),
+        'edges': [{'node': {'shortcode': shortcode, 'taken_at_timestamp': timestamp}} for shortcode, timestamp in posts],
+    }}
+
+
+class FindNewPostsTest(unittest.TestCase):
+    def test_new_posts_oldest_first(self):
+        state = get_post_state(make_timeline(('b', 20), ('a', 10)))
+        timeline = make_timeline(('d', 40), ('c', 30), ('b', 20), ('a', 10))
+
+        self.assertEqual([post['shortcode'] for post in find_new_posts(timeline, state)], ['c', 'd'])
+
+    def test_deleted_post_does_not_hide_new_post(self):
+        state = get_post_state(make_timeline(('b', 20), ('a', 10)))
+        timeline = make_timeline(('c', 30), ('a', 10))
+
+        self.assertEqual([post['shortcode'] for post in find_new_posts(timeline, state)], ['c'])
+
+    def test_old_post_reappearing_is_not_new(self):
+        state = get_post_state(make_timeline(('c', 30), ('b', 20)))
+        timeline = make_timeline(('a', 10), ('c', 30), ('b', 20))
+
+        self.assertEqual(find_new_posts(timeline, state), [])
+
+    def test_state_keeps_newest_timestamp_after_deletion(self):
+        state = get_post_state(make_timeline(('b', 20), ('a', 10)))
+        state = get_post_state(make_timeline(('a', 10)), previous_state=state)
+
+        self.assertEqual(state, {'shortcodes': ['a'], 'newest_timestamp': 20})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import asyncio
+import time
+import unittest
+
+from utils.loop_utils import LoopLagMonitor
+
+
+class LoopLagMonitorTest(unittest.TestCase):
+    def test_no_samples(self):
+        stats = LoopLagMonitor().stats()
+        self.assertEqual(stats['samples'], 0)
+        self.assertEqual(stats['max_ms'], 0.0)
+
+    def test_detects_blocking_call(self):
+        monitor = LoopLagMonitor(interval=0.01)
+
+        async def run():
+            sampler = asyncio.ensure_future(monitor.sample())
+            await asyncio.sleep(0)
+            time.sleep(0.1)
+            return await sampler
+
+        lag = asyncio.run(run())
+        self.assertGreaterEqual(lag, 0.05)
+        self.assertEqual(monitor.stats()['samples'], 1)
+        self.assertGreaterEqual(monitor.stats()['max_ms'], 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from utils.poll_utils import PollScheduler, POLL_DEFAULT_INTERVAL_SECONDS
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+class PollSchedulerTest(unittest.TestCase):
+    def test_new_accounts_are_due_immediately(self):
+        scheduler = PollScheduler()
+        scheduler.add('a', now=100)
+        scheduler.add('b', now=50)
+
+        self.assertEqual(scheduler.due(now=100), ['b', 'a'])
+        self.assertEqual(scheduler.due(now=60), ['b'])
+
+    def test_active_account_polled_more_often_than_idle(self):
+        scheduler = PollScheduler(requests_per_hour=1000)
+        now = 100 * DAY + 12 * HOUR
+
+        scheduler.add('active', now=now)
+        scheduler.add('idle', now=now)
+        scheduler.record_poll('active', [now - i * HOUR for i in range(1, 7)], now=now)
+        scheduler.record_poll('idle', [now - i * 30 * DAY for i in range(1, 7)], now=now)
+
+        stats = scheduler.stats()
+        self.assertLess(stats['active']['interval'], POLL_DEFAULT_INTERVAL_SECONDS)
+        self.assertEqual(stats['idle']['interval'], scheduler.max_interval)
+        self.assertEqual(stats['active']['next_poll_at'], now + stats['active']['interval'])
+        self.assertEqual(scheduler.due(now=now), [])
+
+    def test_active_hours_shorten_interval(self):
+        scheduler = PollScheduler(min_interval=1)
+        post_times = [day * DAY + 20 * HOUR for day in range(1, 7)]
+
+        in_active_hour = scheduler.get_desired_interval(post_times, now=7 * DAY + 20 * HOUR)
+        outside_active_hour = scheduler.get_desired_interval(post_times, now=7 * DAY + 8 * HOUR)
+
+        self.assertLess(in_active_hour, outside_active_hour)
+
+    def test_budget_stretches_all_intervals(self):
+        scheduler = PollScheduler(requests_per_hour=6)
+
+        for i in range(6):
+            scheduler.add(i, now=0)
+
+        # 6 accounts at the default 30 minutes would be 12 requests an hour
+        self.assertEqual(scheduler.stats()[0]['interval'], 2 * POLL_DEFAULT_INTERVAL_SECONDS)
+
+        scheduler.remove(0)
+        scheduler.remove(1)
+        scheduler.remove(2)
+        self.assertEqual(scheduler.stats()[3]['interval'], POLL_DEFAULT_INTERVAL_SECONDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from utils.queue_utils import SpillQueue
+
+
+def make_queue(path, max_size=2):
+    return SpillQueue(max_size=max_size, spill_path=path, serialize=lambda x: x, deserialize=lambda x: x)
+
+
+class SpillQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'spill.jsonl')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_spills_past_max_size_in_order(self):
+        queue = make_queue(self.path)
+
+        for i in range(5):
+            queue.put_nowait(i)
+
+        stats = queue.stats()
+        self.assertEqual(stats['depth'], 5)
+        self.assertEqual(stats['in_memory'], 2)
+        self.assertEqual(stats['spilled'], 3)
+        self.assertGreater(stats['spill_bytes'], 0)
+
+        # Items put while the log is being drained must not overtake it
+        self.assertEqual(queue.get_nowait(), 0)
+        queue.put_nowait(5)
+
+        self.assertEqual([queue.get_nowait() for _ in range(5)], [1, 2, 3, 4, 5])
+        self.assertTrue(queue.empty())
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_replays_log_left_on_disk(self):
+        queue = make_queue(self.path)
+
+        for i in range(5):
+            queue.put_nowait({'id': i})
+
+        restarted_queue = make_queue(self.path)
+
+        self.assertEqual(restarted_queue.qsize(), 3)
+        self.assertEqual(restarted_queue.get_nowait(), {'id': 2})
+
+    def test_skips_torn_last_line(self):
+        queue = make_queue(self.path)
+
+        for i in range(4):
+            queue.put_nowait({'id': i})
+
+        # Cut off in the middle of the last append
+        with open(self.path, 'a') as f:
+            f.write('{"queued_at": 1.0, "item": {"i')
+
+        restarted_queue = make_queue(self.path)
+        restarted_queue.put_nowait({'id': 4})
+
+        self.assertEqual(restarted_queue.qsize(), 4)
+        self.assertEqual([restarted_queue.get_nowait() for _ in range(3)], [{'id': 2}, {'id': 3}, {'id': 4}])
+        self.assertTrue(restarted_queue.empty())
+
+    def test_persist_puts_front_items_first(self):
+        queue = make_queue(self.path)
+
+        for i in range(4):
+            queue.put_nowait(i)
+        queue.get_nowait()
+
+        self.assertEqual(queue.persist(front_items=['in flight']), 4)
+        self.assertTrue(queue.empty())
+
+        restarted_queue = make_queue(self.path, max_size=10)
+        self.assertEqual([restarted_queue.get_nowait() for _ in range(4)], ['in flight', 1, 2, 3])
+        self.assertTrue(restarted_queue.empty())
+
+    def test_get_waits_for_put(self):
+        queue = make_queue(self.path)
+
+        async def run():
+            asyncio.get_event_loop().call_later(0.01, queue.put_nowait, 'tweet')
+            return await asyncio.wait_for(queue.get(), timeout=1)
+
+        self.assertEqual(asyncio.run(run()), 'tweet')
+
+    def test_get_nowait_on_empty(self):
+        with self.assertRaises(asyncio.QueueEmpty):
+            make_queue(self.path).get_nowait()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import asyncio
+import time
+import unittest
+
+from utils.rate_limit_utils import TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_up_to_capacity(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+    def test_acquire_waits_for_refill(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+
+        async def run():
+            await bucket.acquire()
+            start = time.monotonic()
+            await bucket.acquire()
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.015)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import asyncio
+import unittest
+from functools import partial
+
+from aiohttp import ClientConnectionError
+
+from utils.retry_utils import RetryScheduler
+
+
+class RetrySchedulerTest(unittest.TestCase):
+    def test_backoff_is_capped(self):
+        scheduler = RetryScheduler(base_delay=1, max_delay=10, jitter=0)
+
+        self.assertEqual(scheduler.get_delay(1), 1)
+        self.assertEqual(scheduler.get_delay(3), 4)
+        self.assertEqual(scheduler.get_delay(10), 10)
+
+    def test_retries_until_success(self):
+        scheduler = RetryScheduler(base_delay=0.001, jitter=0)
+        attempts = []
+
+        async def send():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ClientConnectionError()
+
+        asyncio.run(scheduler.call('test', 'send', send))
+
+        # Retried in place, nothing left running once the call returns
+        self.assertEqual(len(attempts), 3)
+        self.assertFalse(scheduler.pending)
+        self.assertEqual(scheduler.stats('test'), {'failed': 2, 'retried': 2, 'succeeded': 1, 'recovered': 1})
+        self.assertFalse(scheduler.dead_letters)
+
+    def test_call_keeps_order(self):
+        scheduler = RetryScheduler(base_delay=0.01, jitter=0)
+        sent = []
+
+        async def send(name):
+            if name == 'first' and 'failed' not in sent:
+                sent.append('failed')
+                raise ClientConnectionError()
+
+            sent.append(name)
+
+        async def run():
+            for name in ['first', 'second']:
+                await scheduler.call('test', name, partial(send, name))
+
+        asyncio.run(run())
+
+        self.assertEqual(sent, ['failed', 'first', 'second'])
+
+    def test_dead_letters_after_max_attempts(self):
+        scheduler = RetryScheduler(max_attempts=3, base_delay=0.001, jitter=0)
+
+        async def send():
+            raise ClientConnectionError()
+
+        asyncio.run(scheduler.call('test', 'send', send))
+
+        self.assertEqual(len(scheduler.dead_letters), 1)
+        self.assertEqual(scheduler.dead_letters[0].attempts, 3)
+
+    def test_unretryable_error_is_not_retried(self):
+        scheduler = RetryScheduler(base_delay=0.001, jitter=0)
+
+        async def send():
+            raise ValueError()
+
+        asyncio.run(scheduler.call('test', 'send', send))
+
+        self.assertFalse(scheduler.pending)
+        self.assertEqual(scheduler.dead_letters[0].attempts, 1)
+
+    def test_scheduled_retries_hand_back_items(self):
+        scheduler = RetryScheduler(base_delay=10, jitter=0)
+
+        async def lookup():
+            raise LookupError()
+
+        async def run():
+            scheduler.schedule('hydration', 'lookup', lookup, retry_on=(LookupError,), item='tweet')
+            scheduler.schedule('other', 'lookup', lookup, retry_on=(LookupError,), item='other tweet')
+
+            self.assertTrue(scheduler.has_pending('hydration'))
+            items = scheduler.cancel('hydration')
+
+            self.assertFalse(scheduler.has_pending('hydration'))
+            self.assertTrue(scheduler.has_pending('other'))
+            scheduler.cancel()
+
+            return items
+
+        self.assertEqual(asyncio.run(run()), ['tweet'])
+
+    def test_deferred_call_runs_once_after_backoff(self):
+        scheduler = RetryScheduler(base_delay=0.01, jitter=0)
+        requeued = []
+
+        async def run():
+            scheduler.defer('hydration', 'requeue', 1, partial(requeued.extend, ['a', 'b']), items=['a', 'b'])
+            self.assertTrue(scheduler.has_pending('hydration'))
+            self.assertEqual(requeued, [])
+
+            await asyncio.sleep(0.05)
+
+        asyncio.run(run())
+
+        self.assertEqual(requeued, ['a', 'b'])
+        self.assertFalse(scheduler.pending)
+        self.assertEqual(scheduler.stats('hydration'), {'scheduled': 1, 'retried': 1})
+
+    def test_cancelled_deferred_call_hands_back_items(self):
+        scheduler = RetryScheduler(base_delay=10, jitter=0)
+        requeued = []
+
+        async def run():
+            scheduler.defer('hydration', 'requeue', 1, partial(requeued.extend, ['a', 'b']), items=['a', 'b'])
+            return scheduler.cancel('hydration')
+
+        self.assertEqual(asyncio.run(run()), ['a', 'b'])
+        self.assertEqual(requeued, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from utils.subscription_utils import SubscriptionRegistry, NO_RETWEETS, NO_REPLIES, MEDIA_ONLY
+
+
+class SubscriptionRegistryTest(unittest.TestCase):
+    def test_indexes_stay_in_sync(self):
+        registry = SubscriptionRegistry()
+
+        self.assertTrue(registry.add('1', 100))
+        self.assertFalse(registry.add('1', 100))
+        registry.add('2', 100)
+        registry.add('1', 200)
+
+        self.assertCountEqual(registry.snapshot.get_channels('1'), [100, 200])
+        self.assertCountEqual(registry.snapshot.get_users(100), ['1', '2'])
+
+        self.assertTrue(registry.remove('1', 100))
+        self.assertFalse(registry.remove('1', 100))
+        registry.remove('1', 200)
+
+        self.assertNotIn('1', registry)
+        self.assertEqual(registry.snapshot.get_users(100), ['2'])
+        self.assertEqual(registry.snapshot.get_users(200), [])
+
+    def test_published_snapshot_is_not_mutated(self):
+        registry = SubscriptionRegistry()
+        registry.add('1', 100)
+        snapshot = registry.snapshot
+
+        registry.add('1', 200)
+
+        self.assertEqual(snapshot.get_channels('1'), [100])
+        self.assertIsNot(snapshot, registry.snapshot)
+
+    def test_replies_only_routed_between_stalked_users(self):
+        registry = SubscriptionRegistry()
+        registry.load({'1': [100, 200], '2': [100]})
+
+        self.assertCountEqual(registry.snapshot.route('1'), [100, 200])
+        self.assertEqual(registry.snapshot.route('1', in_reply_to_user_id='2'), [100])
+        self.assertEqual(registry.snapshot.route('1', in_reply_to_user_id='3'), [])
+        self.assertEqual(registry.snapshot.route('3'), [])
+
+    def test_channel_options(self):
+        registry = SubscriptionRegistry()
+        registry.load({'1': [100, 200, 300], '2': [100]},
+                      options={'100': [NO_REPLIES], '200': [NO_RETWEETS], '300': [MEDIA_ONLY]})
+
+        self.assertCountEqual(registry.snapshot.route('1', in_reply_to_user_id='1'), [200, 300])
+        self.assertCountEqual(registry.snapshot.route('1', retweet=True), [100, 300])
+        self.assertCountEqual(registry.snapshot.route('1', media=False), [100, 200])
+        self.assertCountEqual(registry.snapshot.route('1', media=None), [100, 200, 300])
+
+        registry.set_option(200, NO_RETWEETS, False)
+        self.assertEqual(registry.dump_options(), {100: [NO_REPLIES], 300: [MEDIA_ONLY]})
+
+    def test_unknown_option(self):
+        registry = SubscriptionRegistry()
+
+        with self.assertRaises(ValueError):
+            registry.set_option(100, 'nothing', True)
+
+
+if __name__ == '__main__':
+    unittest.main()
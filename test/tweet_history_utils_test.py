@@ -0,0 +1,145 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from datetime import datetime
+
+from utils.tweet_history_utils import TweetHistory, TweetHistoryEntry
+
+
+def get(history, channel_id, visible_id):
+    return asyncio.run(history.get(channel_id, visible_id))
+
+
+def make_entry(main_message_id, timestamp_message_id, embeds=None, timestamp=None):
+    return TweetHistoryEntry(main_message_id, timestamp_message_id, embeds, timestamp)
+
+
+class TweetHistoryTest(unittest.TestCase):
+    def test_put_and_get(self):
+        history = TweetHistory(max_size_per_channel=2)
+        history.put(1, 100, make_entry(10, 11))
+
+        self.assertEqual(get(history, 1, 100), make_entry(10, 11))
+        self.assertIsNone(get(history, 1, 101))
+        self.assertIsNone(get(history, 2, 100))
+
+    def test_bounded_per_channel(self):
+        history = TweetHistory(max_size_per_channel=2)
+        for visible_id in range(5):
+            history.put(1, visible_id, make_entry(visible_id, visible_id))
+        history.put(2, 0, make_entry(0, 0))
+
+        stats = history.stats()
+        self.assertEqual(stats['channels'], 2)
+        self.assertEqual(stats['size'], 3)
+        self.assertEqual(stats['evictions'], 3)
+        self.assertIsNone(get(history, 1, 0))
+        self.assertEqual(get(history, 1, 4), make_entry(4, 4))
+
+    def test_remove_channel(self):
+        history = TweetHistory(max_size_per_channel=2)
+        history.put(1, 100, make_entry(10, 11))
+        history.remove_channel(1)
+        history.remove_channel(2)
+
+        self.assertIsNone(get(history, 1, 100))
+
+
+class PersistentTweetHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, 'history.db')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_survives_restart(self):
+        history = TweetHistory(max_size_per_channel=2, db_path=self.db_path)
+        embeds = [{'title': 'Tweet by someone', 'fields': [{'name': 'Retweeted by', 'value': 'x', 'inline': False}]},
+                  {'image': {'url': 'https://example.com/photo.jpg'}}]
+        timestamp = datetime(2020, 1, 2, 3, 4, 5)
+        history.put(1, 100, make_entry(10, 11, embeds, timestamp))
+        history.close()
+
+        history = TweetHistory(max_size_per_channel=2, db_path=self.db_path)
+        self.assertEqual(get(history, 1, 100), make_entry(10, 11, embeds, timestamp))
+        self.assertEqual(history.stats()['db_hits'], 1)
+        self.assertIsNone(get(history, 1, 101))
+        history.close()
+
+    def test_writes_are_deferred_until_flush(self):
+        history = TweetHistory(max_size_per_channel=2, db_path=self.db_path)
+        history.put(1, 100, make_entry(10, 11))
+        self.assertEqual(history.stats()['pending_writes'], 1)
+
+        other = TweetHistory(max_size_per_channel=2, db_path=self.db_path)
+        self.assertIsNone(get(other, 1, 100))
+
+        history.flush()
+        self.assertEqual(get(other, 1, 100), make_entry(10, 11))
+        history.close()
+        other.close()
+
+    def test_failed_flush_keeps_pending_writes(self):
+        history = TweetHistory(max_size_per_channel=2, db_path=self.db_path)
+        history.put(1, 100, make_entry(10, 11))
+        history.remove_channel(2)
+        history.db.execute('DROP TABLE tweet_history')
+
+        with self.assertRaises(sqlite3.OperationalError):
+            history.flush()
+
+        stats = history.stats()
+        self.assertEqual(stats['pending_writes'], 1)
+        self.assertEqual(stats['pending_deletes'], 1)
+        self.assertEqual(stats['db_writes'], 0)
+
+    def test_remove_channel_deletes_rows(self):
+        history = TweetHistory(max_size_per_channel=2, db_path=self.db_path)
+        history.put(1, 100, make_entry(10, 11))
+        history.put(2, 100, make_entry(20, 21))
+        history.flush()
+        history.remove_channel(1)
+
+        # The delete is only queued, but the channel's rows are already gone for lookups
+        self.assertEqual(history.stats()['pending_deletes'], 1)
+        self.assertIsNone(get(history, 1, 100))
+
+        other = TweetHistory(max_size_per_channel=2, db_path=self.db_path)
+        self.assertEqual(get(other, 1, 100), make_entry(10, 11))
+
+        # Put after the removal, so it outlives the delete
+        history.put(1, 101, make_entry(12, 13))
+        history.flush()
+        other.close()
+
+        other = TweetHistory(max_size_per_channel=2, db_path=self.db_path)
+        self.assertIsNone(get(other, 1, 100))
+        self.assertEqual(get(other, 1, 101), make_entry(12, 13))
+        self.assertEqual(get(other, 2, 100), make_entry(20, 21))
+        history.close()
+        other.close()
+
+    def test_removed_while_loading(self):
+        history = TweetHistory(max_size_per_channel=2, db_path=self.db_path)
+        history.put(1, 100, make_entry(10, 11))
+        history.flush()
+        history.channels.clear()
+
+        async def run():
+            lookup = asyncio.ensure_future(history.get(1, 100))
+            await asyncio.sleep(0)
+            history.remove_channel(1)
+
+            return await lookup
+
+        self.assertIsNone(asyncio.run(run()))
+        self.assertNotIn(1, history.channels)
+        history.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import time
+import unittest
+
+from utils.twitter_stream_utils import StreamRestartController
+
+
+class StreamRestartControllerTest(unittest.TestCase):
+    def test_nothing_pending(self):
+        controller = StreamRestartController()
+        self.assertFalse(controller.is_due())
+
+    def test_debounces_storm_into_one_restart(self):
+        controller = StreamRestartController(debounce_seconds=10, max_delay_seconds=60)
+
+        for i in range(10):
+            controller.request_restart(f'stalked user {i}')
+
+        now = time.monotonic()
+
+        self.assertFalse(controller.is_due(now))
+        self.assertTrue(controller.is_due(now + 10))
+
+        reasons = controller.start_restart()
+        self.assertEqual(len(reasons), 10)
+        self.assertFalse(controller.is_due(now + 100))
+
+    def test_max_delay_caps_debounce(self):
+        controller = StreamRestartController(debounce_seconds=10, max_delay_seconds=30)
+        controller.request_restart('first')
+        controller.first_requested_at -= 30
+
+        self.assertTrue(controller.is_due())
+
+    def test_rate_limit_backs_off_exponentially(self):
+        controller = StreamRestartController(debounce_seconds=0, max_delay_seconds=0)
+
+        controller.request_restart('error', status_code=420)
+        self.assertEqual(controller.backoff_seconds, 60)
+        self.assertFalse(controller.is_due())
+
+        controller.request_restart('error', status_code=420)
+        self.assertEqual(controller.backoff_seconds, 120)
+        self.assertTrue(controller.is_due(time.monotonic() + 120))
+
+    def test_rate_limit_backoff_survives_stream_exit(self):
+        controller = StreamRestartController(debounce_seconds=0, max_delay_seconds=0)
+
+        # The listener reports the error, then the stream thread exits and reports that too
+        for expected_backoff in [60, 120, 240, 480]:
+            controller.request_restart('stream error 420', status_code=420)
+            controller.request_restart('stream terminated', network_error=True)
+
+            self.assertEqual(controller.backoff_seconds, expected_backoff)
+            self.assertFalse(controller.is_due(time.monotonic() + expected_backoff - 1))
+            self.assertTrue(controller.is_due(time.monotonic() + expected_backoff))
+
+            controller.start_restart()
+
+    def test_network_errors_back_off_linearly(self):
+        controller = StreamRestartController(debounce_seconds=0, max_delay_seconds=0)
+
+        for i in range(100):
+            controller.request_restart('stream terminated', network_error=True)
+
+        self.assertEqual(controller.backoff_seconds, 16)
+        self.assertEqual(controller.network_errors, 100)
+
+    def test_connect_resets_backoff_and_records_blind_time(self):
+        controller = StreamRestartController(debounce_seconds=0, max_delay_seconds=0)
+        controller.request_restart('error', status_code=500)
+        controller.start_restart()
+        controller.on_connect()
+
+        stats = controller.stats()
+        self.assertEqual(controller.backoff_seconds, 0)
+        self.assertEqual(stats['restarts'], 1)
+        self.assertEqual(stats['http_errors'], 1)
+        self.assertIsNotNone(controller.history[0].blind_seconds)
+
+
+if __name__ == '__main__':
+    unittest.main()
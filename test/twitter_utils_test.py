@@ -0,0 +1,125 @@
+import unittest
+from datetime import datetime
+
+import tweepy
+from tweepy.models import Status
+
+from utils import twitter_utils
+from utils.twitter_utils import normalize_tweet, has_media, serialize_tweet, deserialize_tweet, get_mock_tweet
+
+USER = {'id': 1, 'id_str': '1', 'screen_name': 'stalked', 'name': 'Stalked'}
+CREATED_AT = 'Wed Oct 10 20:19:24 +0000 2018'
+MEDIA = [{'type': 'photo', 'media_url_https': 'https://pbs.twimg.com/media/photo.jpg'}]
+
+
+def get_payload(tweet_id, text, **fields):
+    payload = {'id': tweet_id, 'id_str': str(tweet_id), 'created_at': CREATED_AT, 'text': text, 'truncated': False,
+               'user': USER, 'entities': {'hashtags': [], 'urls': [], 'user_mentions': []},
+               'in_reply_to_user_id': None, 'in_reply_to_user_id_str': None}
+    payload.update(fields)
+
+    return payload
+
+
+def get_truncated_payload(tweet_id, **fields):
+    return get_payload(tweet_id, 'A long tweet… https://t.co/abc', truncated=True, **fields)
+
+
+def parse(payload):
+    return Status.parse(None, payload)
+
+
+class NormalizeTweetTest(unittest.TestCase):
+    def test_compat_mode_extended_tweet(self):
+        extended_tweet = {'full_text': 'A long tweet with all of its text',
+                          'entities': {'hashtags': [{'text': 'long'}], 'urls': [], 'user_mentions': []},
+                          'extended_entities': {'media': MEDIA}}
+        tweet = parse(get_truncated_payload(10, extended_tweet=extended_tweet))
+
+        self.assertTrue(normalize_tweet(tweet))
+        self.assertEqual(tweet.full_text, 'A long tweet with all of its text')
+        self.assertEqual(tweet.entities['hashtags'], [{'text': 'long'}])
+        self.assertTrue(has_media(tweet))
+
+    def test_truncated_without_extended_tweet(self):
+        tweet = parse(get_truncated_payload(10))
+
+        self.assertFalse(normalize_tweet(tweet))
+        self.assertFalse(hasattr(tweet, 'full_text'))
+
+    def test_short_tweet(self):
+        tweet = parse(get_payload(10, 'A short tweet'))
+
+        self.assertTrue(normalize_tweet(tweet))
+        self.assertEqual(tweet.full_text, 'A short tweet')
+        self.assertFalse(has_media(tweet))
+
+    def test_extended_mode_tweet_is_left_alone(self):
+        tweet = parse(get_payload(10, None, full_text='Already in extended mode'))
+
+        self.assertTrue(normalize_tweet(tweet))
+        self.assertEqual(tweet.full_text, 'Already in extended mode')
+
+    def test_retweet_of_truncated_tweet(self):
+        tweet = parse(get_payload(11, 'RT @other: A long tweet…', retweeted_status=get_truncated_payload(10)))
+
+        self.assertFalse(normalize_tweet(tweet))
+
+    def test_quote_of_truncated_tweet(self):
+        tweet = parse(get_payload(11, 'Look at this', quoted_status=get_truncated_payload(10)))
+
+        self.assertFalse(normalize_tweet(tweet))
+
+    def test_quote_of_compat_mode_tweet(self):
+        quoted_status = get_truncated_payload(10, extended_tweet={'full_text': 'The whole quoted tweet'})
+        tweet = parse(get_payload(11, 'Look at this', quoted_status=quoted_status))
+
+        self.assertTrue(normalize_tweet(tweet))
+        self.assertEqual(tweet.quoted_status.full_text, 'The whole quoted tweet')
+
+    def test_mock_tweet(self):
+        self.assertFalse(normalize_tweet(get_mock_tweet('1', 10)))
+
+
+class SerializeTweetTest(unittest.TestCase):
+    def setUp(self):
+        # Parsing only keeps a reference to the api, it is never called
+        self.tweepy_api = twitter_utils.tweepy_api
+        twitter_utils.tweepy_api = tweepy.API()
+
+    def tearDown(self):
+        twitter_utils.tweepy_api = self.tweepy_api
+
+    def test_status_round_trip(self):
+        tweet = parse(get_payload(10, 'A short tweet', extended_entities={'media': MEDIA}))
+        tweet.channel_ids = [100, 200]
+
+        restored = deserialize_tweet(serialize_tweet(tweet))
+
+        self.assertEqual(restored.id, 10)
+        self.assertEqual(restored.user.id_str, '1')
+        self.assertEqual(restored.channel_ids, [100, 200])
+        self.assertEqual(restored._json, tweet._json)
+        self.assertTrue(normalize_tweet(restored))
+        self.assertTrue(has_media(restored))
+
+    def test_mock_round_trip(self):
+        tweet = get_mock_tweet('1', 10, datetime(2020, 1, 1, 12, 0))
+        tweet.channel_ids = [100]
+
+        restored = deserialize_tweet(serialize_tweet(tweet))
+
+        self.assertEqual(restored.id, 10)
+        self.assertEqual(restored.user.id_str, '1')
+        self.assertEqual(restored.created_at, datetime(2020, 1, 1, 12, 0))
+        self.assertEqual(restored.channel_ids, [100])
+        self.assertFalse(hasattr(restored, '_json'))
+
+    def test_without_channel_ids(self):
+        restored = deserialize_tweet(serialize_tweet(parse(get_payload(10, 'A short tweet'))))
+
+        self.assertFalse(hasattr(restored, 'channel_ids'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
+import asyncio
 import unittest
-from utils.url_utils import get_tweet_ids
+
+from aiohttp import web
+
+from utils.url_utils import get_tweet_ids, unpack_short_link, close_url_session, short_link_cache
 
 
 class GetTweetIdsTest(unittest.TestCase):
@@ -31,5 +35,55 @@ class GetTweetIdsTest(unittest.TestCase):
         self.assertIn('1169955731430227968', ids)
 
 
+class UnpackShortLinkTest(unittest.TestCase):
+    def test_follows_redirects_and_caches(self):
+        requests_seen = []
+
+        async def redirect(request):
+            requests_seen.append(request.path)
+            raise web.HTTPFound('/final')
+
+        async def final(request):
+            requests_seen.append(request.path)
+            return web.Response(text='done')
+
+        async def run():
+            app = web.Application()
+            app.router.add_get('/short', redirect)
+            app.router.add_get('/final', final)
+
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = runner.addresses[0][1]
+
+            try:
+                short_url = f'http://127.0.0.1:{port}/short'
+                first = await unpack_short_link(short_url)
+                second = await unpack_short_link(short_url)
+            finally:
+                short_link_cache.pop(short_url)
+                await close_url_session()
+                await runner.cleanup()
+
+            return port, first, second
+
+        port, first, second = asyncio.run(run())
+        self.assertEqual(first, f'http://127.0.0.1:{port}/final')
+        self.assertEqual(second, first)
+        self.assertEqual(requests_seen, ['/short', '/final'])
+
+    def test_unreachable_link_is_not_cached(self):
+        async def run():
+            try:
+                return await unpack_short_link('http://127.0.0.1:1/short')
+            finally:
+                await close_url_session()
+
+        self.assertEqual(asyncio.run(run()), 'http://127.0.0.1:1/short')
+        self.assertNotIn('http://127.0.0.1:1/short', short_link_cache)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,112 @@
+import asyncio
+import unittest
+
+from utils.worker_utils import ChannelWorkerPool
+
+
+class ChannelWorkerPoolTest(unittest.TestCase):
+    def test_keeps_order_per_channel(self):
+        results = []
+
+        async def job(key, i):
+            await asyncio.sleep(0.001 * (5 - i))
+            results.append((key, i))
+
+        async def run():
+            pool = ChannelWorkerPool(max_concurrency=4)
+
+            for i in range(5):
+                pool.submit('a', lambda i=i: job('a', i))
+                pool.submit('b', lambda i=i: job('b', i))
+
+            while pool.queued() or len(results) < 10:
+                await asyncio.sleep(0.01)
+
+            pool.cancel()
+
+        asyncio.run(run())
+
+        self.assertEqual([i for key, i in results if key == 'a'], list(range(5)))
+        self.assertEqual([i for key, i in results if key == 'b'], list(range(5)))
+
+    def test_slow_channel_does_not_block_others(self):
+        finished = []
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        async def fast():
+            finished.append('fast')
+
+        async def run():
+            pool = ChannelWorkerPool(max_concurrency=2)
+            pool.submit('slow', slow)
+            pool.submit('fast', fast)
+
+            await asyncio.sleep(0.05)
+            pool.cancel()
+
+        asyncio.run(run())
+
+        self.assertEqual(finished, ['fast'])
+
+    def test_failures_do_not_stop_worker(self):
+        results = []
+
+        async def fail():
+            raise ValueError()
+
+        async def succeed():
+            results.append(1)
+
+        async def run():
+            pool = ChannelWorkerPool()
+            pool.submit('a', fail)
+            pool.submit('a', succeed)
+
+            await asyncio.sleep(0.05)
+            stats = pool.stats()
+            pool.cancel()
+            return stats
+
+        stats = asyncio.run(run())
+
+        self.assertEqual(results, [1])
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['completed'], 1)
+
+    def test_cancel_returns_jobs_not_finished(self):
+        async def slow():
+            await asyncio.sleep(1)
+
+        async def run():
+            pool = ChannelWorkerPool(max_concurrency=1)
+            pool.submit('a', slow, item='first')
+            pool.submit('a', slow, item='second')
+            pool.submit('b', slow, item='third')
+
+            await asyncio.sleep(0.01)
+            self.assertTrue(pool.busy())
+            return pool.cancel()
+
+        pending = asyncio.run(run())
+
+        self.assertEqual([(key, item) for submitted_at, key, item in pending],
+                         [('a', 'first'), ('a', 'second'), ('b', 'third')])
+
+    def test_idle_worker_exits(self):
+        async def job():
+            pass
+
+        async def run():
+            pool = ChannelWorkerPool(idle_timeout=0.01)
+            pool.submit('a', job)
+
+            await asyncio.sleep(0.05)
+            return pool.stats()['workers']
+
+        self.assertEqual(asyncio.run(run()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
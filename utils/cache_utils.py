@@ -0,0 +1,78 @@
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_size: int, ttl: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        try:
+            expires_at, value = self.items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.items[key]
+            self.misses += 1
+            self.evictions += 1
+            return default
+
+        self.items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def pop(self, key, default=None):
+        try:
+            return self.items.pop(key)[1]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        self.items[key] = (expires_at, value)
+        self.items.move_to_end(key)
+
+        self.evict_expired()
+
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+            self.evictions += 1
+
+    def evict_expired(self):
+        if self.ttl is None:
+            return
+
+        now = time.monotonic()
+
+        # Entries are kept in insertion/access order, but a hit does not extend the expiry,
+        # so stop at the first live entry and leave the rest to be expired on access
+        while self.items:
+            key, (expires_at, _) = next(iter(self.items.items()))
+
+            if expires_at > now:
+                break
+
+            del self.items[key]
+            self.evictions += 1
+
+    def __contains__(self, key):
+        if key not in self.items:
+            return False
+
+        expires_at, _ = self.items[key]
+        return expires_at is None or expires_at > time.monotonic()
+
+    def __len__(self):
+        return len(self.items)
+
+    def stats(self):
+        return {'size': len(self.items), 'max_size': self.max_size,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
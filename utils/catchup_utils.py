@@ -0,0 +1,23 @@
+def get_resumable_user_ids(last_seen_ids: dict, user_ids: list):
+    # Users with a high-water mark from before a restart, everything they posted since can be fetched by since_id
+    return [user_id for user_id in user_ids if user_id in last_seen_ids]
+
+
+async def get_tweets_since(get_timeline, user_id, since_id: int, rate_limit, page_size: int, max_pages: int,
+                           skip_ids=()):
+    # Pages backwards from the newest tweet down to since_id, get_timeline is the async user_timeline call
+    tweets = []
+    max_id = None
+
+    for _ in range(max_pages):
+        await rate_limit.acquire()
+        page = await get_timeline(user_id, count=page_size, max_id=max_id, since_id=since_id)
+
+        tweets.extend(tweet for tweet in page if tweet.id not in skip_ids)
+
+        if len(page) < page_size:
+            break
+
+        max_id = page[-1].id - 1
+
+    return tweets
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import logging
 
@@ -8,14 +9,14 @@ from regex import regex
 
 from utils.discord_embed_utils import get_photo_embed, get_named_link
 from utils.twitter_utils import extract_text, get_tweet_url, extract_photo_urls, get_profile_url, is_reply, \
-    get_user, is_quote, is_retweet, get_hashtag_url, extract_main_photo_url
+    get_user_async, is_quote, is_retweet, get_hashtag_url, extract_main_photo_url
 from utils.url_utils import unpack_short_link
 
 logger = logging.getLogger(__name__)
 TWITTER_COLOR = int('1DA1F2', base=16)
 
-def get_tweet_embeds(tweet, color: int = TWITTER_COLOR):
-    embeds = [get_main_tweet_embed(tweet, color)] + get_remaining_photo_embeds(tweet, color)
+async def get_tweet_embeds(tweet, color: int = TWITTER_COLOR):
+    embeds = [await get_main_tweet_embed(tweet, color)] + get_remaining_photo_embeds(tweet, color)
 
     embeds[-1].add_tweet_footer(tweet)
 
@@ -27,20 +28,20 @@ def get_tweet_embeds(tweet, color: int = TWITTER_COLOR):
     return embeds
 
 
-def get_main_tweet_embed(tweet, color: int = None):
+async def get_main_tweet_embed(tweet, color: int = None):
     if is_reply(tweet):
-        embed = get_reply_tweet_embed(tweet)
+        embed = await get_reply_tweet_embed(tweet)
     elif is_retweet(tweet):
         embed = get_retweet_embed(tweet)
     elif is_quote(tweet):
-        embed = get_quoted_tweet_embed(tweet)
+        embed = await get_quoted_tweet_embed(tweet)
     else:
         embed = get_standard_tweet_embed(tweet)
 
     if color:
         embed.colour = color
 
-    embed.description = fix_tweet_text(embed.description, tweet)
+    embed.description = await fix_tweet_text(embed.description, tweet)
 
     embed.set_author(name=f'{tweet.user.name} (@{tweet.user.screen_name})',
                      url=get_profile_url(tweet.user),
@@ -62,8 +63,8 @@ def get_standard_tweet_embed(tweet):
     return embed
 
 
-def get_reply_tweet_embed(tweet):
-    replied_user = get_user(screen_name=tweet.in_reply_to_screen_name)
+async def get_reply_tweet_embed(tweet):
+    replied_user = await get_user_async(screen_name=tweet.in_reply_to_screen_name)
     escaped_screen_name = replied_user.screen_name.replace('_', '\_')
 
     embed = Embed(url=get_tweet_url(tweet),
@@ -78,7 +79,7 @@ def get_reply_tweet_embed(tweet):
     return embed
 
 
-def get_quoted_tweet_embed(tweet):
+async def get_quoted_tweet_embed(tweet):
     quoted_tweet = tweet.quoted_status
 
     embed = Embed(url=get_tweet_url(tweet),
@@ -93,7 +94,7 @@ def get_quoted_tweet_embed(tweet):
     quoted_text = extract_text(quoted_tweet)
 
     embed.add_field(name=f'Quote',
-                    value=author_info + fix_tweet_text(quoted_text, quoted_tweet),
+                    value=author_info + await fix_tweet_text(quoted_text, quoted_tweet),
                     inline=False)
 
     original_photo_urls = extract_photo_urls(tweet)
@@ -138,11 +139,11 @@ def get_remaining_photo_embeds(tweet, color: int = None):
     return embeds
 
 
-def get_user_embed(user, color: int = None):
+async def get_user_embed(user, color: int = None):
     icon_url = user.profile_image_url_https.replace('_normal', '')
     banner_url = f'{user.profile_banner_url}/1500x500'
 
-    embed = Embed(description=fix_user_text(user.description, user))
+    embed = Embed(description=await fix_user_text(user.description, user))
     embed.set_thumbnail(url=icon_url)
     embed.set_author(name=f'{user.name} (@{user.screen_name})',
                      url=get_profile_url(user),
@@ -168,7 +169,7 @@ def get_color_embed(message: str, color: int):
     return Embed(description=message, color=color)
 
 
-def fix_tweet_text(text: str, tweet):
+async def fix_tweet_text(text: str, tweet):
     if is_retweet(tweet):
         tweet = tweet.retweeted_status
 
@@ -186,7 +187,7 @@ def fix_tweet_text(text: str, tweet):
     else:
         text = replace_mention_with_link(text, tweet.entities.get('user_mentions'))
 
-    text = expand_short_links(text, tweet.entities.get('urls'))
+    text = await expand_short_links(text, tweet.entities.get('urls'))
 
     text = delete_media_links(text, tweet.entities.get('media'))
     text = delete_quote_links(text, tweet)
@@ -194,10 +195,10 @@ def fix_tweet_text(text: str, tweet):
     return text.strip()
 
 
-def fix_user_text(text: str, user):
+async def fix_user_text(text: str, user):
     text = replace_hashtag_with_link(text)
     text = fix_escape_characters(text)
-    text = expand_short_links(text, user.entities['description']['urls'])
+    text = await expand_short_links(text, user.entities['description']['urls'])
 
     return text.strip()
 
@@ -252,12 +253,13 @@ def replace_mention_with_link(text: str, user_mentions_entities, in_reply_to_scr
     return text
 
 
-def expand_short_links(text: str, urls_entities):
+async def expand_short_links(text: str, urls_entities):
     if not urls_entities:
         return text
 
-    for url in urls_entities:
-        full_link = unpack_short_link(url['expanded_url'])
+    full_links = await asyncio.gather(*[unpack_short_link(url['expanded_url']) for url in urls_entities])
+
+    for url, full_link in zip(urls_entities, full_links):
         escaped_link = urllib.parse.unquote(full_link)
         text = text.replace(url['url'], get_named_link(escaped_link, full_link))
 
@@ -1,7 +1,12 @@
 import re
 
+from discord.http import Route
 from discord.utils import escape_mentions
 
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARACTERS_PER_MESSAGE = 6000
+MAX_MESSAGE_LENGTH = 2000
+
 
 def filter_nsfw(message: str):
     return re.sub(r'<.*>', '', message)
@@ -21,3 +26,44 @@ def clean_message(message: str, modules=None):
         ret = module(ret)
 
     return ret
+
+
+def pack_embeds(embeds: list):
+    # Discord allows up to 10 embeds per message, with a combined 6000 characters
+    chunks = [[]]
+    chunk_length = 0
+
+    for embed in embeds:
+        if chunks[-1] and (len(chunks[-1]) == MAX_EMBEDS_PER_MESSAGE or
+                           chunk_length + len(embed) > MAX_EMBED_CHARACTERS_PER_MESSAGE):
+            chunks.append([])
+            chunk_length = 0
+
+        chunks[-1].append(embed)
+        chunk_length += len(embed)
+
+    return [chunk for chunk in chunks if chunk]
+
+
+async def send_embeds(http, channel_id: int, embeds: list):
+    # discord.py's Messageable.send only takes a single embed, so post the payload directly
+    message_ids = []
+
+    for chunk in pack_embeds(embeds):
+        route = Route('POST', '/channels/{channel_id}/messages', channel_id=channel_id)
+        data = await http.request(route, json={'embeds': [embed.to_dict() for embed in chunk]})
+        message_ids.append(int(data['id']))
+
+    return message_ids
+
+
+def pack_lines(lines: list, max_length: int = MAX_MESSAGE_LENGTH):
+    messages = ['']
+
+    for line in lines:
+        if messages[-1] and len(messages[-1]) + len(line) + 1 > max_length:
+            messages.append('')
+
+        messages[-1] = f'{messages[-1]}\n{line}' if messages[-1] else line
+
+    return [message for message in messages if message]
@@ -1,30 +1,68 @@
 import asyncio
-from datetime import datetime
+from datetime import datetime, timezone
 
 import aiohttp
 
+from utils.rate_limit_utils import TokenBucket
+
 INSTAGRAM_POST_PROXY_URL = 'https://instagram.com/tv/'
 INSTAGRAM_TIMELINE_PROXY_URL = 'https://instagram.com/tv/'
 
+INSTA_MAX_CONNECTIONS_PER_HOST = 8
+INSTA_DNS_CACHE_TTL_SECONDS = 300
+INSTA_KEEPALIVE_SECONDS = 60
+INSTA_CONNECT_TIMEOUT_SECONDS = 5
+INSTA_READ_TIMEOUT_SECONDS = 10
+INSTA_TOTAL_TIMEOUT_SECONDS = 20
+# Shared by everything that talks to Instagram, it is quick to block an IP that fetches in bursts
+INSTA_REQUESTS_PER_SECOND = 0.5
+INSTA_BURST = 5
+
+insta_session = None
+insta_rate_limit = TokenBucket(rate=INSTA_REQUESTS_PER_SECOND, capacity=INSTA_BURST)
+
+def get_insta_session():
+    global insta_session
+
+    # One long-lived session so that requests reuse connections instead of a TCP and TLS handshake each
+    if insta_session is None or insta_session.closed:
+        connector = aiohttp.TCPConnector(limit_per_host=INSTA_MAX_CONNECTIONS_PER_HOST,
+                                         ttl_dns_cache=INSTA_DNS_CACHE_TTL_SECONDS,
+                                         keepalive_timeout=INSTA_KEEPALIVE_SECONDS)
+        timeout = aiohttp.ClientTimeout(total=INSTA_TOTAL_TIMEOUT_SECONDS,
+                                        sock_connect=INSTA_CONNECT_TIMEOUT_SECONDS,
+                                        sock_read=INSTA_READ_TIMEOUT_SECONDS)
+        insta_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    return insta_session
+
+async def close_insta_session():
+    global insta_session
+
+    if insta_session is not None and not insta_session.closed:
+        await insta_session.close()
+
+    insta_session = None
+
 async def get_insta_post(shortcode: str):
     request_url = INSTAGRAM_POST_PROXY_URL + shortcode
+    await insta_rate_limit.acquire()
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(request_url) as resp:
-                ret = await resp.json()
-                return ret["entry_data"]["PostPage"][0]["graphql"]["shortcode_media"]
-    except asyncio.TimeoutError:
+        async with get_insta_session().get(request_url) as resp:
+            ret = await resp.json()
+            return ret["entry_data"]["PostPage"][0]["graphql"]["shortcode_media"]
+    except (asyncio.TimeoutError, aiohttp.ClientError):
         return None
 
 async def get_insta_timeline(username: str):
     request_url = INSTAGRAM_TIMELINE_PROXY_URL + username
+    await insta_rate_limit.acquire()
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(request_url) as resp:
-                return await resp.json()
-    except asyncio.TimeoutError:
+        async with get_insta_session().get(request_url) as resp:
+            return await resp.json()
+    except (asyncio.TimeoutError, aiohttp.ClientError):
         return None
 
 def get_insta_post_url(shortcode: str):
@@ -80,6 +118,9 @@ def extract_likes(post: dict):
 def extract_timestamp(post: dict):
     return datetime.utcfromtimestamp(int(post['taken_at_timestamp']))
 
+def extract_post_times(timeline: dict):
+    return [extract_timestamp(post).replace(tzinfo=timezone.utc).timestamp() for post in extract_recent_posts(timeline)]
+
 def extract_post_count(timeline: dict):
     return timeline['edge_owner_to_timeline_media']['count']
 
@@ -93,6 +134,25 @@ def extract_recent_posts(timeline: dict, max_posts=12):
 
     return ret
 
+def find_new_posts(timeline: dict, state: dict):
+    # Set difference on shortcodes rather than a post count, so deleted posts don't hide new ones.
+    # Posts older than the newest one seen (pinned, unarchived) are never new. Oldest first
+    seen_shortcodes = set(state['shortcodes'])
+    posts = extract_recent_posts(timeline)
+
+    return [post for post in reversed(posts) if post['shortcode'] not in seen_shortcodes
+            and int(post['taken_at_timestamp']) > state['newest_timestamp']]
+
+def get_post_state(timeline: dict, previous_state: dict = None):
+    # Only the latest page can come back, so that is all there is to remember
+    posts = extract_recent_posts(timeline)
+    timestamps = [int(post['taken_at_timestamp']) for post in posts]
+
+    if previous_state:
+        timestamps.append(previous_state['newest_timestamp'])
+
+    return {'shortcodes': [post['shortcode'] for post in posts], 'newest_timestamp': max(timestamps, default=0)}
+
 def get_hashtag_url(hashtag: str):
     if hashtag.startswith('#') or hashtag.startswith('＃'):
         return f'https://www.instagram.com/explore/tags/{hashtag[1:]}/'
@@ -0,0 +1,36 @@
+import asyncio
+import time
+from collections import deque
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.5, window: int = 240):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+
+    async def sample(self):
+        # Anything that blocks the event loop delays this wake-up, so the overshoot is the loop lag
+        start = time.monotonic()
+        await asyncio.sleep(self.interval)
+        lag = max(time.monotonic() - start - self.interval, 0.0)
+
+        self.samples.append(lag)
+        self.max_lag = max(self.max_lag, lag)
+
+        return lag
+
+    def stats(self):
+        if not self.samples:
+            return {'samples': 0, 'avg_ms': 0.0, 'p99_ms': 0.0, 'window_max_ms': 0.0, 'max_ms': self.max_lag * 1000}
+
+        sorted_samples = sorted(self.samples)
+        p99_idx = min(len(sorted_samples) - 1, int(len(sorted_samples) * 0.99))
+
+        return {
+            'samples': len(sorted_samples),
+            'avg_ms': sum(sorted_samples) / len(sorted_samples) * 1000,
+            'p99_ms': sorted_samples[p99_idx] * 1000,
+            'window_max_ms': sorted_samples[-1] * 1000,
+            'max_ms': self.max_lag * 1000,
+        }
@@ -0,0 +1,96 @@
+import time
+
+POLL_MIN_INTERVAL_SECONDS = 5 * 60
+POLL_MAX_INTERVAL_SECONDS = 6 * 60 * 60
+POLL_DEFAULT_INTERVAL_SECONDS = 30 * 60
+POLL_REQUESTS_PER_HOUR = 120
+
+# Poll this many times per typical gap between posts
+POLLS_PER_POST_GAP = 4
+# Poll twice as often in the hours an account usually posts in
+ACTIVE_HOUR_FACTOR = 0.5
+MAX_POST_HISTORY = 50
+
+
+class AccountPollState:
+    def __init__(self, next_poll_at: float):
+        self.post_times = []
+        self.desired_interval = POLL_DEFAULT_INTERVAL_SECONDS
+        self.interval = POLL_DEFAULT_INTERVAL_SECONDS
+        self.last_polled_at = None
+        self.next_poll_at = next_poll_at
+
+
+class PollScheduler:
+    def __init__(self, requests_per_hour: float = POLL_REQUESTS_PER_HOUR,
+                 min_interval: float = POLL_MIN_INTERVAL_SECONDS, max_interval: float = POLL_MAX_INTERVAL_SECONDS):
+        self.requests_per_hour = requests_per_hour
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.accounts = {}
+
+    def add(self, key, now: float = None):
+        now = time.time() if now is None else now
+
+        if key not in self.accounts:
+            self.accounts[key] = AccountPollState(next_poll_at=now)
+            self.rebalance()
+
+    def remove(self, key):
+        if self.accounts.pop(key, None) is not None:
+            self.rebalance()
+
+    def due(self, now: float = None):
+        now = time.time() if now is None else now
+        due_accounts = [(state.next_poll_at, key) for key, state in self.accounts.items() if state.next_poll_at <= now]
+
+        return [key for next_poll_at, key in sorted(due_accounts, key=lambda x: x[0])]
+
+    def record_poll(self, key, post_times: list, now: float = None):
+        now = time.time() if now is None else now
+        state = self.accounts[key]
+
+        # Timelines only show the latest page, history keeps older posts around to learn from
+        state.post_times = sorted(set(state.post_times) | set(post_times))[-MAX_POST_HISTORY:]
+        state.desired_interval = self.get_desired_interval(state.post_times, now)
+        state.last_polled_at = now
+
+        self.rebalance()
+
+    def get_desired_interval(self, post_times: list, now: float):
+        if len(post_times) < 2:
+            return POLL_DEFAULT_INTERVAL_SECONDS
+
+        gaps = sorted(later - earlier for earlier, later in zip(post_times, post_times[1:]))
+        typical_gap = max(gaps[len(gaps) // 2], 1)
+        interval = typical_gap / POLLS_PER_POST_GAP
+
+        # Gone quiet for far longer than usual, check less and less often
+        quiet_time = now - post_times[-1]
+        if quiet_time > typical_gap * 2:
+            interval *= quiet_time / (typical_gap * 2)
+
+        # Hours are in UTC, which is fine since all that matters is that they are consistent per account
+        hour = time.gmtime(now).tm_hour
+        nearby_hours = {(hour - 1) % 24, hour, (hour + 1) % 24}
+        nearby_posts = sum(1 for post_time in post_times if time.gmtime(post_time).tm_hour in nearby_hours)
+
+        if nearby_posts / len(post_times) >= 2 * len(nearby_hours) / 24:
+            interval *= ACTIVE_HOUR_FACTOR
+
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def rebalance(self):
+        # Stretch everyone by the same factor when the desired intervals add up to more than the budget
+        demand = sum(60 * 60 / state.desired_interval for state in self.accounts.values())
+        scale = max(1.0, demand / self.requests_per_hour)
+
+        for state in self.accounts.values():
+            state.interval = state.desired_interval * scale
+
+            if state.last_polled_at is not None:
+                state.next_poll_at = state.last_polled_at + state.interval
+
+    def stats(self):
+        return {key: {'interval': state.interval, 'next_poll_at': state.next_poll_at}
+                for key, state in self.accounts.items()}
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class SpillQueue:
+    # Bounded in memory, anything past max_size goes to an append-only log on disk and comes back in order.
+    # Items are written with the injected serialize/deserialize, which have to round trip through JSON
+    def __init__(self, max_size: int, spill_path: str, serialize, deserialize):
+        self.max_size = max_size
+        self.spill_path = spill_path
+        self.serialize = serialize
+        self.deserialize = deserialize
+
+        self.items = deque()
+        self.not_empty = asyncio.Event()
+        self.read_offset = 0
+        self.spilled = 0
+        self.total_spilled = 0
+
+        # Whatever was still on disk when we last stopped goes first
+        if os.path.exists(spill_path):
+            with open(spill_path, 'rb+') as f:
+                self.spilled = sum(1 for line in f if line.strip())
+
+                # A crash in the middle of an append leaves a torn last line, end it so that the next append
+                # doesn't get glued onto it
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+
+                    if f.read(1) != b'\n':
+                        f.write(b'\n')
+
+            self.refill()
+
+    def put_nowait(self, item, queued_at: float = None):
+        queued_at = time.time() if queued_at is None else queued_at
+
+        # Once spilling, everything goes to disk until it is drained, otherwise newer items would overtake it
+        if self.spilled or len(self.items) >= self.max_size:
+            with open(self.spill_path, 'a') as f:
+                f.write(json.dumps({'queued_at': queued_at, 'item': self.serialize(item)}) + '\n')
+
+            self.spilled += 1
+            self.total_spilled += 1
+        else:
+            self.items.append((queued_at, item))
+
+        self.not_empty.set()
+
+    def get_nowait(self):
+        if not self.items:
+            self.refill()
+
+        if not self.items:
+            raise asyncio.QueueEmpty()
+
+        queued_at, item = self.items.popleft()
+
+        if not self.items and not self.spilled:
+            self.not_empty.clear()
+
+        return item
+
+    async def get(self):
+        while self.empty():
+            await self.not_empty.wait()
+
+        return self.get_nowait()
+
+    def refill(self):
+        if not self.spilled:
+            return
+
+        try:
+            f = open(self.spill_path)
+        except FileNotFoundError:
+            self.spilled = 0
+            return
+
+        with f:
+            f.seek(self.read_offset)
+
+            while self.spilled and len(self.items) < self.max_size:
+                line = f.readline()
+
+                if not line:
+                    # The log was lost or cut short, nothing more to replay
+                    self.spilled = 0
+                    break
+
+                self.read_offset = f.tell()
+
+                if not line.strip():
+                    continue
+
+                self.spilled -= 1
+
+                try:
+                    entry = json.loads(line)
+                    queued_at, item = entry['queued_at'], entry['item']
+                except (ValueError, KeyError):
+                    logger.warning(f'Skipping unreadable line in {self.spill_path}: {line[:100]!r}')
+                    continue
+
+                self.items.append((queued_at, self.deserialize(item)))
+
+        if not self.spilled:
+            os.remove(self.spill_path)
+            self.read_offset = 0
+
+    def persist(self, front_items: list = ()):
+        # Writes everything still queued to the log, front_items first, so the next start replays it before
+        # anything new. The queue is empty afterwards
+        now = time.time()
+        entries = [(now, self.serialize(item)) for item in front_items]
+        entries.extend((queued_at, self.serialize(item)) for queued_at, item in self.items)
+
+        remaining_lines = []
+        if self.spilled and os.path.exists(self.spill_path):
+            with open(self.spill_path) as f:
+                f.seek(self.read_offset)
+                remaining_lines = [line for line in f if line.strip()]
+
+        temp_path = f'{self.spill_path}.tmp'
+        with open(temp_path, 'w') as f:
+            for queued_at, item in entries:
+                f.write(json.dumps({'queued_at': queued_at, 'item': item}) + '\n')
+            f.writelines(remaining_lines)
+
+        os.replace(temp_path, self.spill_path)
+
+        self.items.clear()
+        self.spilled = 0
+        self.read_offset = 0
+        self.not_empty.clear()
+
+        return len(entries) + len(remaining_lines)
+
+    def empty(self):
+        return not self.items and not self.spilled
+
+    def qsize(self):
+        return len(self.items) + self.spilled
+
+    def stats(self):
+        spill_bytes = os.path.getsize(self.spill_path) - self.read_offset if self.spilled else 0
+
+        return {
+            'depth': self.qsize(),
+            'in_memory': len(self.items),
+            'max_size': self.max_size,
+            'spilled': self.spilled,
+            'spill_bytes': spill_bytes,
+            'total_spilled': self.total_spilled,
+            'oldest_age_seconds': time.time() - self.items[0][0] if self.items else 0.0,
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque, namedtuple
+
+from aiohttp import ClientConnectionError
+
+logger = logging.getLogger(__name__)
+
+retry_scheduler = None
+
+RETRY_MAX_ATTEMPTS = 6
+RETRY_BASE_DELAY_SECONDS = 2.0
+RETRY_MAX_DELAY_SECONDS = 300.0
+RETRY_JITTER = 0.5
+MAX_DEAD_LETTERS = 100
+
+# Errors worth sending again, anything else (e.g. missing permissions) fails straight into the dead letters
+RETRYABLE_ERRORS = (ClientConnectionError, asyncio.TimeoutError)
+
+DeadLetter = namedtuple('DeadLetter', ['category', 'name', 'attempts', 'error', 'failed_at'])
+
+
+class RetryScheduler:
+    def __init__(self, max_attempts: int = RETRY_MAX_ATTEMPTS, base_delay: float = RETRY_BASE_DELAY_SECONDS,
+                 max_delay: float = RETRY_MAX_DELAY_SECONDS, jitter: float = RETRY_JITTER):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+        self.pending = {}
+        self.dead_letters = deque(maxlen=MAX_DEAD_LETTERS)
+        self.counters = {}
+
+    def get_delay(self, attempt: int):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+
+        # Spread out retries that failed together so they don't all come back at once
+        return delay * random.uniform(1 - self.jitter, 1)
+
+    async def call(self, category: str, name: str, func, retry_on=RETRYABLE_ERRORS):
+        # Retries are awaited in place, so a caller working through an ordered queue (e.g. a channel worker)
+        # waits for them instead of letting newer jobs overtake
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                result = await func()
+            except retry_on as e:
+                self.count(category, 'failed')
+
+                if attempt == self.max_attempts:
+                    self.dead_letter(category, name, attempt, e)
+                    return None
+
+                await self.back_off(category, name, attempt)
+            except Exception as e:
+                self.count(category, 'failed')
+                self.dead_letter(category, name, attempt, e)
+                return None
+            else:
+                self.count(category, 'succeeded')
+                if attempt > 1:
+                    self.count(category, 'recovered')
+
+                return result
+
+    def schedule(self, category: str, name: str, func, retry_on=RETRYABLE_ERRORS, item=None):
+        # For work that has no order to keep, retried in the background. item is handed back by cancel
+        self.count(category, 'scheduled')
+        task = asyncio.ensure_future(self.retry(category, name, func, retry_on))
+        self.track(task, category, [item] if item is not None else [])
+
+    def defer(self, category: str, name: str, attempt: int, func, items: list = ()):
+        # Calls func once after the backoff for attempt, for callers that batch their own retries (e.g. putting
+        # items back on a queue). items are handed back by cancel
+        self.count(category, 'scheduled')
+        task = asyncio.ensure_future(self.call_later(category, name, attempt, func))
+        self.track(task, category, list(items))
+
+    async def call_later(self, category: str, name: str, attempt: int, func):
+        await self.back_off(category, name, attempt)
+        func()
+
+    def track(self, task, category: str, items: list):
+        self.pending[task] = (category, items)
+        task.add_done_callback(lambda done_task: self.pending.pop(done_task, None))
+
+    async def retry(self, category: str, name: str, func, retry_on):
+        for attempt in range(1, self.max_attempts + 1):
+            await self.back_off(category, name, attempt)
+
+            try:
+                await func()
+            except retry_on as e:
+                self.count(category, 'failed')
+
+                if attempt == self.max_attempts:
+                    self.dead_letter(category, name, attempt, e)
+            except Exception as e:
+                self.count(category, 'failed')
+                self.dead_letter(category, name, attempt, e)
+                return
+            else:
+                self.count(category, 'succeeded')
+                self.count(category, 'recovered')
+                return
+
+    async def back_off(self, category: str, name: str, attempt: int):
+        delay = self.get_delay(attempt)
+        logger.info(f'Retrying {name} in {delay:.1f}s (attempt {attempt + 1}/{self.max_attempts})')
+        self.count(category, 'retried')
+        await asyncio.sleep(delay)
+
+    def dead_letter(self, category: str, name: str, attempts: int, error):
+        logger.info(f'Giving up on {name} after {attempts} attempts: {error!r}')
+        self.count(category, 'dead_lettered')
+        self.dead_letters.append(DeadLetter(category=category, name=name, attempts=attempts, error=repr(error),
+                                            failed_at=time.time()))
+
+    def count(self, category: str, counter: str):
+        counters = self.counters.setdefault(category, {})
+        counters[counter] = counters.get(counter, 0) + 1
+
+    def has_pending(self, category: str):
+        return any(task_category == category for task_category, items in self.pending.values())
+
+    def cancel(self, category: str = None):
+        # Returns the items of the background retries that were cancelled
+        items = []
+
+        for task, (task_category, task_items) in list(self.pending.items()):
+            if category is None or task_category == category:
+                task.cancel()
+                del self.pending[task]
+                items.extend(task_items)
+
+        return items
+
+    def stats(self, category: str = None):
+        if category is not None:
+            return dict(self.counters.get(category, {}))
+
+        return {'pending': len(self.pending), 'dead_letters': len(self.dead_letters), **self.counters}
+
+
+def get_retry_scheduler():
+    global retry_scheduler
+
+    if not retry_scheduler:
+        retry_scheduler = RetryScheduler()
+
+    return retry_scheduler
@@ -0,0 +1,126 @@
+from threading import Lock
+
+NO_RETWEETS = 'noretweets'
+NO_REPLIES = 'noreplies'
+MEDIA_ONLY = 'mediaonly'
+CHANNEL_OPTIONS = (NO_RETWEETS, NO_REPLIES, MEDIA_ONLY)
+
+
+class SubscriptionSnapshot:
+    # Never mutated once published, so the stream threads can read it without locking
+    def __init__(self, destinations: dict, users: dict, options: dict):
+        self.destinations = destinations
+        self.users = users
+        self.options = options
+
+        # Everything a tweet needs to be routed, behind one lookup on the author
+        self.routes = {user_id: tuple((channel_id, options.get(channel_id, frozenset()), users[channel_id])
+                                      for channel_id in channel_ids)
+                       for user_id, channel_ids in destinations.items()}
+
+    def get_channels(self, user_id: str):
+        return list(self.destinations.get(user_id, ()))
+
+    def get_users(self, channel_id: int):
+        return list(self.users.get(channel_id, ()))
+
+    def route(self, user_id: str, in_reply_to_user_id: str = None, retweet: bool = False, media: bool = None):
+        # media is None when it is not known yet, which lets the tweet through media-only channels
+        channel_ids = []
+
+        for channel_id, options, channel_users in self.routes.get(user_id, ()):
+            if in_reply_to_user_id is not None and (NO_REPLIES in options or in_reply_to_user_id not in channel_users):
+                continue
+            if retweet and NO_RETWEETS in options:
+                continue
+            if media is False and MEDIA_ONLY in options:
+                continue
+
+            channel_ids.append(channel_id)
+
+        return channel_ids
+
+
+class SubscriptionRegistry:
+    def __init__(self):
+        self.lock = Lock()
+        self.destinations = {}
+        self.users = {}
+        self.options = {}
+        self.snapshot = SubscriptionSnapshot({}, {}, {})
+
+    def __contains__(self, user_id: str):
+        return user_id in self.snapshot.destinations
+
+    def add(self, user_id: str, channel_id: int):
+        with self.lock:
+            if channel_id in self.destinations.get(user_id, ()):
+                return False
+
+            self.destinations.setdefault(user_id, set()).add(channel_id)
+            self.users.setdefault(channel_id, set()).add(user_id)
+            self.publish()
+
+        return True
+
+    def remove(self, user_id: str, channel_id: int):
+        with self.lock:
+            if channel_id not in self.destinations.get(user_id, ()):
+                return False
+
+            self.destinations[user_id].discard(channel_id)
+            self.users[channel_id].discard(user_id)
+
+            if not self.destinations[user_id]:
+                del self.destinations[user_id]
+
+            if not self.users[channel_id]:
+                del self.users[channel_id]
+                self.options.pop(channel_id, None)
+
+            self.publish()
+
+        return True
+
+    def set_option(self, channel_id: int, option: str, enabled: bool):
+        if option not in CHANNEL_OPTIONS:
+            raise ValueError(f'Unknown channel option {option}')
+
+        with self.lock:
+            if enabled:
+                self.options.setdefault(channel_id, set()).add(option)
+            elif channel_id in self.options:
+                self.options[channel_id].discard(option)
+
+                if not self.options[channel_id]:
+                    del self.options[channel_id]
+
+            self.publish()
+
+    def publish(self):
+        # Swapping the reference is atomic, readers see either the old or the new snapshot in full
+        self.snapshot = SubscriptionSnapshot(
+            destinations={user_id: frozenset(channel_ids) for user_id, channel_ids in self.destinations.items()},
+            users={channel_id: frozenset(user_ids) for channel_id, user_ids in self.users.items()},
+            options={channel_id: frozenset(options) for channel_id, options in self.options.items()})
+
+    def load(self, destinations: dict, options: dict = None):
+        with self.lock:
+            for user_id, channel_ids in destinations.items():
+                for channel_id in channel_ids:
+                    self.destinations.setdefault(user_id, set()).add(channel_id)
+                    self.users.setdefault(channel_id, set()).add(user_id)
+
+            # JSON turns the channel IDs into strings
+            for channel_id, channel_options in (options or {}).items():
+                self.options[int(channel_id)] = set(channel_options) & set(CHANNEL_OPTIONS)
+
+            self.publish()
+
+    def dump_destinations(self):
+        snapshot = self.snapshot
+        return {user_id: sorted(channel_ids) for user_id, channel_ids in snapshot.destinations.items()}
+
+    def dump_options(self):
+        snapshot = self.snapshot
+        return {channel_id: sorted(options) for channel_id, options in snapshot.options.items()}
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import sqlite3
+import time
+from collections import namedtuple
+from datetime import datetime
+from threading import Lock
+
+from utils.cache_utils import LRUCache
+
+# embeds are the main message's embed payloads and timestamp the posted tweet's time as they were sent,
+# so that retweets can be merged without fetching the messages back from Discord
+TweetHistoryEntry = namedtuple('TweetHistoryEntry', ['main_message_id', 'timestamp_message_id', 'embeds', 'timestamp'])
+
+
+class TweetHistory:
+    def __init__(self, max_size_per_channel: int, ttl: float = None, db_path: str = None):
+        self.max_size_per_channel = max_size_per_channel
+        self.ttl = ttl
+        self.channels = {}
+        self.pending_writes = []
+        self.pending_deletes = set()
+        # Bumped whenever a channel is removed, so a lookup that was running at the time doesn't bring it back
+        self.generations = {}
+        self.db_hits = 0
+        self.db_writes = 0
+
+        # The connection is shared between executor threads (lazy reads and flushes)
+        self.db_lock = Lock()
+        self.db = None
+
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS tweet_history ('
+                            'channel_id INTEGER NOT NULL, '
+                            'visible_tweet_id INTEGER NOT NULL, '
+                            'main_message_id INTEGER NOT NULL, '
+                            'timestamp_message_id INTEGER NOT NULL, '
+                            'posted_at REAL NOT NULL, '
+                            'embed TEXT, '
+                            'timestamp TEXT, '
+                            'PRIMARY KEY (channel_id, visible_tweet_id))')
+            self.db.execute('CREATE INDEX IF NOT EXISTS tweet_history_posted_at ON tweet_history (posted_at)')
+
+            # Databases created before embeds were cached
+            columns = [row[1] for row in self.db.execute('PRAGMA table_info(tweet_history)')]
+            for column in ('embed', 'timestamp'):
+                if column not in columns:
+                    self.db.execute(f'ALTER TABLE tweet_history ADD COLUMN {column} TEXT')
+
+            self.db.commit()
+
+    async def get(self, channel_id: int, visible_id: int):
+        channel_history = self.channels.get(channel_id)
+
+        if channel_history is not None:
+            entry = channel_history.get(visible_id)
+
+            if entry is not None:
+                return entry
+
+        if not self.db:
+            return None
+
+        generation = self.generations.get(channel_id, 0)
+        entry = await asyncio.get_event_loop().run_in_executor(None, self.load, channel_id, visible_id)
+
+        if generation != self.generations.get(channel_id, 0):
+            return None
+
+        if entry is not None:
+            self.db_hits += 1
+            self.get_channel_history(channel_id)[visible_id] = entry
+
+        return entry
+
+    def put(self, channel_id: int, visible_id: int, entry: TweetHistoryEntry):
+        self.get_channel_history(channel_id)[visible_id] = entry
+
+        if self.db:
+            embeds = json.dumps(entry.embeds) if entry.embeds is not None else None
+            timestamp = entry.timestamp.isoformat() if entry.timestamp is not None else None
+
+            with self.db_lock:
+                self.pending_writes.append((channel_id, visible_id, entry.main_message_id, entry.timestamp_message_id,
+                                            time.time(), embeds, timestamp))
+
+    def get_channel_history(self, channel_id: int):
+        if channel_id not in self.channels:
+            self.channels[channel_id] = LRUCache(max_size=self.max_size_per_channel, ttl=self.ttl)
+
+        return self.channels[channel_id]
+
+    def remove_channel(self, channel_id: int):
+        self.channels.pop(channel_id, None)
+        self.generations[channel_id] = self.generations.get(channel_id, 0) + 1
+
+        # Deleted with the next flush, before any rows that are put after this
+        if self.db:
+            with self.db_lock:
+                self.pending_writes = [row for row in self.pending_writes if row[0] != channel_id]
+                self.pending_deletes.add(channel_id)
+
+    def load(self, channel_id: int, visible_id: int):
+        # Blocking, run this off the event loop
+        if not self.db:
+            return None
+
+        query = 'SELECT main_message_id, timestamp_message_id, embed, timestamp FROM tweet_history ' \
+                'WHERE channel_id = ? AND visible_tweet_id = ?'
+        params = [channel_id, visible_id]
+
+        if self.ttl is not None:
+            query += ' AND posted_at > ?'
+            params.append(time.time() - self.ttl)
+
+        with self.db_lock:
+            # Closed in the meantime, or the channel's rows are about to be deleted
+            if not self.db or channel_id in self.pending_deletes:
+                return None
+
+            row = self.db.execute(query, params).fetchone()
+
+        if not row:
+            return None
+
+        main_message_id, timestamp_message_id, embeds, timestamp = row
+        embeds = json.loads(embeds) if embeds is not None else None
+
+        # Messages used to hold a single embed
+        if isinstance(embeds, dict):
+            embeds = [embeds]
+
+        return TweetHistoryEntry(main_message_id=main_message_id,
+                                 timestamp_message_id=timestamp_message_id,
+                                 embeds=embeds,
+                                 timestamp=datetime.fromisoformat(timestamp) if timestamp is not None else None)
+
+    def flush(self):
+        # Blocking, run this off the event loop
+        if not self.db:
+            return
+
+        with self.db_lock:
+            rows, self.pending_writes = self.pending_writes, []
+            channel_ids, self.pending_deletes = self.pending_deletes, set()
+
+            try:
+                if channel_ids:
+                    self.db.executemany('DELETE FROM tweet_history WHERE channel_id = ?',
+                                        [(channel_id,) for channel_id in channel_ids])
+
+                if rows:
+                    self.db.executemany('INSERT OR REPLACE INTO tweet_history (channel_id, visible_tweet_id, '
+                                        'main_message_id, timestamp_message_id, posted_at, embed, timestamp) '
+                                        'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+                if self.ttl is not None:
+                    self.db.execute('DELETE FROM tweet_history WHERE posted_at <= ?', (time.time() - self.ttl,))
+
+                self.db.commit()
+            except Exception:
+                # Kept for the next flush instead of being lost
+                self.db.rollback()
+                self.pending_writes = rows + self.pending_writes
+                self.pending_deletes |= channel_ids
+                raise
+
+            self.db_writes += len(rows)
+
+    def close(self):
+        if not self.db:
+            return
+
+        self.flush()
+
+        with self.db_lock:
+            self.db.close()
+            self.db = None
+
+    def stats(self):
+        channel_stats = [channel_history.stats() for channel_history in self.channels.values()]
+
+        return {
+            'channels': len(channel_stats),
+            'size': sum(stats['size'] for stats in channel_stats),
+            'max_size_per_channel': self.max_size_per_channel,
+            'hits': sum(stats['hits'] for stats in channel_stats),
+            'misses': sum(stats['misses'] for stats in channel_stats),
+            'evictions': sum(stats['evictions'] for stats in channel_stats),
+            'db_hits': self.db_hits,
+            'db_writes': self.db_writes,
+            'pending_writes': len(self.pending_writes),
+            'pending_deletes': len(self.pending_deletes),
+        }
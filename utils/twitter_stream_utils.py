@@ -0,0 +1,138 @@
+import time
+from collections import deque
+from threading import Lock
+
+# Follow set changes are held until nothing has changed for DEBOUNCE_SECONDS, but never longer than MAX_DELAY_SECONDS
+DEBOUNCE_SECONDS = 20.0
+MAX_DELAY_SECONDS = 120.0
+
+# Backoff schedule from https://developer.twitter.com/en/docs/tweets/filter-realtime/guides/connecting
+RATE_LIMITED_BACKOFF_START_SECONDS = 60.0
+RATE_LIMITED_BACKOFF_CAP_SECONDS = 960.0
+HTTP_ERROR_BACKOFF_START_SECONDS = 5.0
+HTTP_ERROR_BACKOFF_CAP_SECONDS = 320.0
+NETWORK_ERROR_BACKOFF_STEP_SECONDS = 0.25
+NETWORK_ERROR_BACKOFF_CAP_SECONDS = 16.0
+
+RATE_LIMITED_STATUS_CODES = (420, 429)
+MAX_RESTART_HISTORY = 50
+
+
+class RestartRecord:
+    def __init__(self, reasons: list, requested_at: float, started_at: float):
+        self.reasons = reasons
+        self.requested_at = requested_at
+        self.started_at = started_at
+        self.connected_at = None
+
+    @property
+    def blind_seconds(self):
+        if self.connected_at is None:
+            return None
+
+        return self.connected_at - self.started_at
+
+
+class StreamRestartController:
+    # Requests come from both the stream thread and the event loop
+    def __init__(self, debounce_seconds: float = DEBOUNCE_SECONDS, max_delay_seconds: float = MAX_DELAY_SECONDS):
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.lock = Lock()
+
+        self.pending_reasons = []
+        self.first_requested_at = None
+        self.last_requested_at = None
+
+        self.backoff_seconds = 0.0
+        self.backoff_until = 0.0
+        self.rate_limited_errors = 0
+        self.http_errors = 0
+        self.network_errors = 0
+
+        self.history = deque(maxlen=MAX_RESTART_HISTORY)
+        self.current_restart = None
+
+    def request_restart(self, reason: str, status_code: int = None, network_error: bool = False):
+        with self.lock:
+            now = time.monotonic()
+
+            if status_code is not None:
+                self.back_off_http_error(status_code, now)
+            elif network_error:
+                self.back_off_network_error(now)
+
+            self.pending_reasons.append(reason)
+            self.last_requested_at = now
+
+            if self.first_requested_at is None:
+                self.first_requested_at = now
+
+    def back_off_http_error(self, status_code: int, now: float):
+        if status_code in RATE_LIMITED_STATUS_CODES:
+            self.rate_limited_errors += 1
+            self.backoff_seconds = min(max(self.backoff_seconds * 2, RATE_LIMITED_BACKOFF_START_SECONDS),
+                                       RATE_LIMITED_BACKOFF_CAP_SECONDS)
+        else:
+            self.http_errors += 1
+            self.backoff_seconds = min(max(self.backoff_seconds * 2, HTTP_ERROR_BACKOFF_START_SECONDS),
+                                       HTTP_ERROR_BACKOFF_CAP_SECONDS)
+
+        self.backoff_until = now + self.backoff_seconds
+
+    def back_off_network_error(self, now: float):
+        self.network_errors += 1
+        # Never cuts short a longer backoff from an HTTP error, e.g. the stream thread exiting after a 420
+        self.backoff_seconds = max(self.backoff_seconds,
+                                   min(self.backoff_seconds + NETWORK_ERROR_BACKOFF_STEP_SECONDS,
+                                       NETWORK_ERROR_BACKOFF_CAP_SECONDS))
+        self.backoff_until = max(self.backoff_until, now + self.backoff_seconds)
+
+    def is_due(self, now: float = None):
+        now = time.monotonic() if now is None else now
+
+        with self.lock:
+            if not self.pending_reasons or now < self.backoff_until:
+                return False
+
+            return now - self.last_requested_at >= self.debounce_seconds or \
+                now - self.first_requested_at >= self.max_delay_seconds
+
+    def start_restart(self):
+        with self.lock:
+            now = time.monotonic()
+            record = RestartRecord(reasons=self.pending_reasons, requested_at=self.first_requested_at, started_at=now)
+
+            self.pending_reasons = []
+            self.first_requested_at = None
+            self.last_requested_at = None
+
+            self.current_restart = record
+            self.history.append(record)
+
+            return record.reasons
+
+    def on_connect(self):
+        with self.lock:
+            # Only a successful connection resets the backoff
+            self.backoff_seconds = 0.0
+            self.backoff_until = 0.0
+
+            if self.current_restart is not None:
+                self.current_restart.connected_at = time.monotonic()
+                self.current_restart = None
+
+    def stats(self):
+        with self.lock:
+            blind_durations = [record.blind_seconds for record in self.history if record.blind_seconds is not None]
+
+            return {
+                'restarts': len(self.history),
+                'pending_reasons': list(self.pending_reasons),
+                'backoff_seconds': self.backoff_seconds,
+                'rate_limited_errors': self.rate_limited_errors,
+                'http_errors': self.http_errors,
+                'network_errors': self.network_errors,
+                'total_blind_seconds': sum(blind_durations),
+                'max_blind_seconds': max(blind_durations, default=0.0),
+            }
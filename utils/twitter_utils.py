@@ -1,10 +1,20 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
 import tweepy
 from tweepy import TweepError
+from tweepy.models import Status
 
 from utils.credentials_utils import get_credentials
 from utils.url_utils import get_photo_url
 
 tweepy_api = None
+tweepy_executor = None
+
+TWEEPY_MAX_WORKERS = 8
+MAX_LOOKUP_SIZE = 100
 
 
 def init_tweepy(credentials_file='credentials.json'):
@@ -12,10 +22,26 @@ def init_tweepy(credentials_file='credentials.json'):
 
     credentials = get_credentials(credentials_file)
 
-    auth = tweepy.OAuthHandler(credentials['twitter']['consumerKey'], credentials['twitter']['consumerSecret'])
-    auth.set_access_token(credentials['twitter']['accessToken'], credentials['twitter']['accessTokenSecret'])
+    tweepy_api = tweepy.API(get_auth(credentials['twitter']))
+
+
+def get_auth(twitter_credentials: dict):
+    auth = tweepy.OAuthHandler(twitter_credentials['consumerKey'], twitter_credentials['consumerSecret'])
+    auth.set_access_token(twitter_credentials['accessToken'], twitter_credentials['accessTokenSecret'])
 
-    tweepy_api = tweepy.API(auth)
+    return auth
+
+
+def get_stream_auths(credentials_file='credentials.json'):
+    # Standard access allows one standing filter connection per account,
+    # so every stream past the first needs its own account under twitter.streamAccounts
+    credentials = get_credentials(credentials_file)
+    stream_accounts = credentials['twitter'].get('streamAccounts')
+
+    if not stream_accounts:
+        return [get_tweepy().auth]
+
+    return [get_auth(stream_account) for stream_account in stream_accounts]
 
 
 def get_tweepy():
@@ -27,6 +53,21 @@ def get_tweepy():
     return tweepy_api
 
 
+def get_tweepy_executor():
+    global tweepy_executor
+
+    if not tweepy_executor:
+        tweepy_executor = ThreadPoolExecutor(max_workers=TWEEPY_MAX_WORKERS, thread_name_prefix='tweepy')
+
+    return tweepy_executor
+
+
+async def run_in_tweepy_executor(func, *args, **kwargs):
+    # Tweepy is blocking, so every call made from a coroutine has to go through here
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(get_tweepy_executor(), partial(func, *args, **kwargs))
+
+
 def is_retweet(tweet):
     return hasattr(tweet, 'retweeted_status')
 
@@ -70,6 +111,16 @@ def extract_main_photo_url(tweet):
     return photo_urls[0] if photo_urls else None
 
 
+def has_media(tweet):
+    if is_retweet(tweet):
+        return has_media(tweet.retweeted_status)
+
+    if 'media' in getattr(tweet, 'extended_entities', {}):
+        return True
+
+    return is_quote(tweet) and has_media(tweet.quoted_status)
+
+
 def extract_displayed_video_url(tweet):
     if is_quote(tweet):
         original_video_url = extract_video_url(tweet)
@@ -105,6 +156,36 @@ def extract_visible_id(tweet):
     return tweet.retweeted_status.id if is_retweet(tweet) else tweet.id
 
 
+def normalize_tweet(tweet):
+    # Stream payloads come in compatibility mode, where long tweets keep their full text and entities
+    # under extended_tweet. Fills in the extended mode fields in place, returns False if the tweet
+    # still has to be looked up (truncated without extended_tweet, or a mock tweet)
+    if not hasattr(tweet, '_json'):
+        return False
+
+    if not hasattr(tweet, 'full_text'):
+        extended_tweet = getattr(tweet, 'extended_tweet', None)
+
+        if extended_tweet is not None:
+            tweet.full_text = extended_tweet['full_text']
+            tweet.entities = extended_tweet.get('entities', tweet.entities)
+
+            if 'extended_entities' in extended_tweet:
+                tweet.extended_entities = extended_tweet['extended_entities']
+        elif getattr(tweet, 'truncated', False):
+            return False
+        else:
+            tweet.full_text = tweet.text
+
+    if is_retweet(tweet) and not normalize_tweet(tweet.retweeted_status):
+        return False
+
+    if is_quote(tweet) and not normalize_tweet(tweet.quoted_status):
+        return False
+
+    return True
+
+
 def get_tweet_url(tweet):
     return f'https://twitter.com/{tweet.user.screen_name}/status/{tweet.id}'
 
@@ -132,6 +213,16 @@ def get_tweet(tweet_id: int):
     return api.get_status(tweet_id, tweet_mode='extended')
 
 
+def get_tweets(tweet_ids: list):
+    api = get_tweepy()
+
+    if len(tweet_ids) > MAX_LOOKUP_SIZE:
+        raise ValueError(f'Can only look up {MAX_LOOKUP_SIZE} tweets at a time')
+
+    # Tweets that are deleted or protected are silently left out of the response
+    return api.statuses_lookup(tweet_ids, tweet_mode='extended')
+
+
 def get_user(user_id=None, screen_name=None):
     api = get_tweepy()
 
@@ -146,10 +237,26 @@ def get_user(user_id=None, screen_name=None):
     return None
 
 
-def get_timeline(user_id, count=50, max_id=None):
+def get_timeline(user_id, count=50, max_id=None, since_id=None):
     api = get_tweepy()
 
-    return api.user_timeline(user_id=user_id, count=count, max_id=max_id)
+    return api.user_timeline(user_id=user_id, count=count, max_id=max_id, since_id=since_id)
+
+
+async def get_tweet_async(tweet_id: int):
+    return await run_in_tweepy_executor(get_tweet, tweet_id)
+
+
+async def get_tweets_async(tweet_ids: list):
+    return await run_in_tweepy_executor(get_tweets, tweet_ids)
+
+
+async def get_user_async(user_id=None, screen_name=None):
+    return await run_in_tweepy_executor(get_user, user_id=user_id, screen_name=screen_name)
+
+
+async def get_timeline_async(user_id, count=50, max_id=None, since_id=None):
+    return await run_in_tweepy_executor(get_timeline, user_id, count=count, max_id=max_id, since_id=since_id)
 
 
 def get_mock_tweet(user_id, tweet_id, created_at=None):
@@ -167,3 +274,32 @@ def get_mock_tweet(user_id, tweet_id, created_at=None):
         mock_tweet.created_at = created_at
 
     return mock_tweet
+
+
+def serialize_tweet(tweet):
+    if hasattr(tweet, '_json'):
+        data = {'status': tweet._json}
+    else:
+        created_at = getattr(tweet, 'created_at', None)
+        data = {'mock': {'user_id': tweet.user.id_str, 'id': tweet.id,
+                         'created_at': created_at.isoformat() if created_at else None}}
+
+    # Set on tweets that were only partly delivered, so they only go to the channels that are still missing them
+    if hasattr(tweet, 'channel_ids'):
+        data['channel_ids'] = tweet.channel_ids
+
+    return data
+
+
+def deserialize_tweet(data):
+    if 'status' in data:
+        tweet = Status.parse(get_tweepy(), data['status'])
+    else:
+        mock = data['mock']
+        created_at = datetime.fromisoformat(mock['created_at']) if mock['created_at'] else None
+        tweet = get_mock_tweet(mock['user_id'], mock['id'], created_at)
+
+    if 'channel_ids' in data:
+        tweet.channel_ids = data['channel_ids']
+
+    return tweet
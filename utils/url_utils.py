@@ -1,12 +1,22 @@
+import asyncio
 import http
 import re
 from collections import OrderedDict
 
-import requests
-from urllib3.exceptions import InsecureRequestWarning
+import aiohttp
 from urllib.parse import urljoin
 
-requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
+from utils.cache_utils import LRUCache
+
+MAX_REDIRECTS = 5
+SHORT_LINK_TIMEOUT_SECONDS = 5
+SHORT_LINK_MAX_CONCURRENCY = 10
+SHORT_LINK_CACHE_SIZE = 4096
+SHORT_LINK_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+url_session = None
+url_semaphore = None
+short_link_cache = LRUCache(max_size=SHORT_LINK_CACHE_SIZE, ttl=SHORT_LINK_CACHE_TTL_SECONDS)
 
 def get_tweet_ids(s: str):
     regex = re.compile(r'(?:http[s]?://)?twitter\.com/[^/]*/status/([0-9]*)(?:\?[^ \r\n]*)?')
@@ -56,27 +66,66 @@ def get_youtube_video_ids(s: str):
 
     return list(OrderedDict.fromkeys(ret))
 
-def unpack_short_link(s: str):
-    MAX_REDIRECTS = 5
+def get_url_session():
+    global url_session
+
+    if url_session is None or url_session.closed:
+        connector = aiohttp.TCPConnector(limit=SHORT_LINK_MAX_CONCURRENCY, ssl=False)
+        timeout = aiohttp.ClientTimeout(total=SHORT_LINK_TIMEOUT_SECONDS)
+        url_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    return url_session
+
+
+def get_url_semaphore():
+    global url_semaphore
+
+    if url_semaphore is None:
+        url_semaphore = asyncio.Semaphore(SHORT_LINK_MAX_CONCURRENCY)
+
+    return url_semaphore
+
+
+async def close_url_session():
+    global url_session, url_semaphore
+
+    if url_session is not None and not url_session.closed:
+        await url_session.close()
+
+    url_session = None
+    url_semaphore = None
+
+
+async def unpack_short_link(s: str):
+    full_link = short_link_cache.get(s)
+
+    if full_link is None:
+        async with get_url_semaphore():
+            full_link, is_resolved = await follow_redirects(s)
+
+        # Failed lookups are not cached so that they get retried the next time the link shows up
+        if is_resolved:
+            short_link_cache[s] = full_link
+
+    return full_link
+
+
+async def follow_redirects(s: str):
+    session = get_url_session()
     curr_redirects = 0
 
-    prev_url = s
-    while curr_redirects < MAX_REDIRECTS:
+    while curr_redirects < MAX_REDIRECTS and not has_insta_links(s):
         try:
-            res = requests.get(s, allow_redirects=False, verify=False)
-        except requests.exceptions.MissingSchema:
-            # Occurs when URL is relative
-            try:
-                s = urljoin(prev_url, s)
-                res = requests.get(s, allow_redirects=False, verify=False)
-            except Exception:
-                break
-
-        if not has_insta_links(s) and (res.status_code == http.HTTPStatus.MOVED_PERMANENTLY or res.status_code == http.HTTPStatus.FOUND):
-            prev_url = s
-            s = res.headers['Location']
-            curr_redirects += 1
-        else:
-            break
-
-    return s
+            async with session.get(s, allow_redirects=False) as res:
+                if res.status not in (http.HTTPStatus.MOVED_PERMANENTLY, http.HTTPStatus.FOUND):
+                    break
+
+                # Reading the (small) redirect body lets the connection go back to the pool
+                await res.read()
+                # Location may be relative
+                s = urljoin(s, res.headers['Location'])
+                curr_redirects += 1
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError):
+            return s, False
+
+    return s, True
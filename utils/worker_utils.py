@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+WORKER_MAX_CONCURRENCY = 10
+WORKER_IDLE_TIMEOUT_SECONDS = 300.0
+LATENCY_WINDOW = 1000
+
+
+class ChannelWorkerPool:
+    # One worker per key (channel) so each channel gets its jobs in order while channels progress in parallel,
+    # with a shared semaphore capping how many jobs run at once across all of them
+    def __init__(self, max_concurrency: int = WORKER_MAX_CONCURRENCY,
+                 idle_timeout: float = WORKER_IDLE_TIMEOUT_SECONDS):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.idle_timeout = idle_timeout
+        self.queues = {}
+        self.workers = {}
+        self.waiting = {}
+        self.active = {}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, key, func, item=None):
+        # item is what the job works on, handed back by cancel if the job didn't get to finish
+        if key not in self.workers:
+            self.queues[key] = asyncio.Queue()
+            self.workers[key] = asyncio.ensure_future(self.worker(key))
+
+        self.queues[key].put_nowait((time.monotonic(), func, item))
+
+    async def worker(self, key):
+        queue = self.queues[key]
+
+        while True:
+            try:
+                job = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                # Nothing can be submitted between the timeout and here, so the queue is empty for sure
+                del self.queues[key]
+                del self.workers[key]
+                return
+
+            submitted_at, func, item = job
+            # Taken off the queue but not started until there is room under the semaphore
+            self.waiting[key] = job
+
+            try:
+                async with self.semaphore:
+                    del self.waiting[key]
+                    self.active[key] = job
+                    self.running += 1
+
+                    try:
+                        await func()
+                    finally:
+                        self.running -= 1
+                        self.active.pop(key, None)
+
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                logger.exception(f'Worker {key} failed to run a job')
+
+            self.latencies.append(time.monotonic() - submitted_at)
+
+    def queued(self):
+        return sum(queue.qsize() for queue in self.queues.values())
+
+    def busy(self):
+        return self.running > 0 or len(self.waiting) > 0 or self.queued() > 0
+
+    def cancel(self):
+        for worker in self.workers.values():
+            worker.cancel()
+
+        # Returns (submitted_at, key, item) for every job that didn't finish, oldest first. That includes the ones
+        # cut off while running, e.g. in the middle of retrying
+        pending = [(submitted_at, key, item) for key, (submitted_at, func, item) in self.active.items()]
+        pending.extend((submitted_at, key, item) for key, (submitted_at, func, item) in self.waiting.items())
+        for key, queue in self.queues.items():
+            while not queue.empty():
+                submitted_at, func, item = queue.get_nowait()
+                pending.append((submitted_at, key, item))
+
+        self.queues = {}
+        self.workers = {}
+        self.waiting = {}
+        self.active = {}
+
+        return sorted(pending, key=lambda x: x[0])
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        return {
+            'workers': len(self.workers),
+            'queued': self.queued(),
+            'max_concurrency': self.max_concurrency,
+            'completed': self.completed,
+            'failed': self.failed,
+            'avg_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+            'p99_latency': latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+        }